@@ -0,0 +1,113 @@
+# Cache of the rows read from the imported files
+#
+# The same month's files are often imported again (e.g. to send the report to someone
+# else). The rows read from the files are saved in a cache directory under a key made
+# from the contents of the files and the settings used to read them, so reading the
+# same files with the same settings again takes the rows from the cache. Scoring the
+# rows is fast (see session.py), so changing a scoring rule does not need a new entry.
+#
+# The cache keeps at most max_entries entries; the least recently used entries are
+# removed first. Entries can be removed one at a time (invalidate) or all at once
+# (clear). Only cache directories written by this program should be used (pickle).
+
+import os
+import json
+import pickle
+import hashlib
+import tempfile
+
+from discovery import Archives, split_archive_path
+
+default_cache_dir = os.path.join(os.path.expanduser('~'), '.losap', 'cache')
+default_max_entries = 20
+
+cache_version = 3
+
+
+def file_hash(file_name, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory=default_cache_dir, max_entries=default_max_entries):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def key(self, kind, files, config):
+        # files: one file name or a list; the name (it is kept in the 'Source' column)
+        # and the contents of each file are part of the key, the folder is not. For a file
+        # in a zip archive, its size and CRC-32 stand for the contents
+        if isinstance(files, str):
+            files = [files]
+        h = hashlib.sha256()
+        h.update(json.dumps([cache_version, kind, config], sort_keys=True, default=str).encode())
+        with Archives() as archives:
+            for file_name in files:
+                h.update(os.path.basename(file_name).encode())
+                if split_archive_path(file_name)[0] is None:
+                    h.update(file_hash(file_name).encode())
+                else:
+                    h.update(archives.checksum(file_name).encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def get(self, key):
+        # the cached value, or None
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # a damaged entry is removed and read again
+            print("Error reading the cache:", e)
+            self.invalidate(key)
+            return None
+        # mark the entry as recently used
+        os.utime(path)
+        return value
+
+    def put(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        # write to a temporary file first, so a damaged entry is never left behind
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path(key))
+        except Exception:
+            os.remove(tmp)
+            raise
+        self.evict()
+
+    def entries(self):
+        # (time last used, path) of all entries, least recently used first
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pickle'):
+                entries.append((entry.stat().st_mtime, entry.path))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            os.remove(path)
+
+    def invalidate(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for _, path in self.entries():
+            os.remove(path)
@@ -0,0 +1,84 @@
+# Compact in-memory representation of the activity data
+#
+# Member names and activity types repeat on every activity row. They are stored as
+# categoricals: one string per distinct value plus a small integer code per row. Hours
+# and points are stored as float32; the spreadsheets use whole, half and quarter
+# hours/points, which float32 holds exactly, so the totals do not change.
+#
+# The per-member summary has one row per member and keeps float64 columns, since values
+# like 'Tour of Duty' (hours / 12, rounded to 0.01) are not exact in float32.
+#
+# Run this file to print the memory used per 100k activity rows before and after.
+
+import sys
+import numpy as np
+import pandas as pd
+
+activity_number_columns = ['Hours', 'Points']
+activity_category_columns = ['Member Name', 'Activity', 'Category', 'Source']
+
+
+def map_names(names, func):
+    # Apply func once per distinct name instead of once per row; returns a categorical.
+    # Only the codes of the rows are renumbered, the names are not copied per row
+    names = names.astype('category')
+    mapped = pd.Index([func(name) for name in names.cat.categories], dtype=object)
+    # two names can become the same name (e.g. a double space removed)
+    new_codes, categories = pd.factorize(mapped)
+    codes = names.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, new_codes.take(codes.clip(min=0)), -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=names.index)
+
+
+def compact_activities(df):
+    df = df.copy()
+    for col in activity_category_columns:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    for col in activity_number_columns:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float32')
+    return df
+
+
+def to_summary(df):
+    # grouped results are merged into the summary, which keeps plain string names
+    # and float64 points
+    df['Member Name'] = df['Member Name'].astype(str)
+    for col in df.columns:
+        if df[col].dtype == np.float32:
+            df[col] = df[col].astype('float64')
+    return df
+
+
+def memory_usage(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def sample_activities(n_rows=100000, n_members=300, seed=0):
+    # Activity rows as they come out of the self-report import (before compacting)
+    rng = np.random.default_rng(seed)
+    members = ['Member' + str(i) + ', First' + str(i) for i in range(n_members)]
+    activities = ['Meetings', 'Drills, CMEs', 'Training Course', 'Miscellaneous', 'Disability']
+    return pd.DataFrame({
+        'Member Name': pd.Series([members[i] for i in rng.integers(0, n_members, n_rows)], dtype=object),
+        'Date': pd.to_datetime('2015-01-01') + pd.to_timedelta(rng.integers(0, 3650, n_rows), unit='D'),
+        'Activity': pd.Series([activities[i] for i in rng.integers(0, len(activities), n_rows)], dtype=object),
+        'Hours': rng.integers(1, 17, n_rows) / 4.0,
+        'Points': rng.integers(0, 5, n_rows) / 2.0,
+    })
+
+
+def memory_report(n_rows=100000):
+    df = sample_activities(n_rows)
+    before = memory_usage(df)
+    after = memory_usage(compact_activities(df))
+    return {'rows': n_rows, 'before': before, 'after': after}
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    report = memory_report(n)
+    print('Activity rows: ' + str(report['rows']))
+    print('Memory before: {:,.0f} KB'.format(report['before'] / 1024))
+    print('Memory after:  {:,.0f} KB'.format(report['after'] / 1024))
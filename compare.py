@@ -0,0 +1,107 @@
+# Comparison of two summaries, e.g. a month before and after corrections, or this year
+# and last year
+#
+# A summary can be a saved session (.losap), an exported workbook (the 'Points Summary'
+# sheet) or an exported CSV, Parquet or JSON Lines file. The two summaries are joined
+# on the member name (one hash join), and the points of all members and categories are
+# compared at once. The report lists the members that were added or removed and, for
+# the other members, every category whose points changed.
+
+import os
+import numpy as np
+import pandas as pd
+
+from scoring import colnames, colnamestoadd
+from session import Session
+from export import export_table, table_format, write_summary_workbook
+
+compared_columns = colnamestoadd + ['Total']
+
+report_columns = ['Member Name', 'Status', 'Category', 'Old', 'New', 'Change']
+
+# points that differ by less than this are the same (rounding of the exported values)
+tolerance = 0.005
+
+
+def load_summary(file_name, sheet_name='Points Summary'):
+    # the summary table of a saved session or an exported file
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext == '.losap':
+        return Session.load(file_name).summary
+    if ext in ('.xlsx', '.xls'):
+        sheets = pd.ExcelFile(file_name).sheet_names
+        df = pd.read_excel(file_name, sheet_name=sheet_name if sheet_name in sheets else 0)
+    elif ext == '.csv':
+        df = pd.read_csv(file_name)
+    elif ext == '.parquet':
+        df = pd.read_parquet(file_name)
+    elif ext == '.jsonl':
+        df = pd.read_json(file_name, lines=True)
+    else:
+        raise ValueError('Unknown summary file: ' + os.path.basename(file_name))
+    if 'Member Name' not in df.columns:
+        raise ValueError(os.path.basename(file_name) + " has no 'Member Name' column")
+    return df
+
+
+def compare_summaries(old, new):
+    # the report of the differences between two summary tables (see report_columns)
+    columns = [c for c in compared_columns if c in old.columns or c in new.columns]
+    old = old[old['Member Name'].notna()].drop_duplicates('Member Name')
+    new = new[new['Member Name'].notna()].drop_duplicates('Member Name')
+    df = pd.merge(old.assign(**{'Member Name': old['Member Name'].astype(str)}).reindex(
+                      columns=['Member Name'] + columns),
+                  new.assign(**{'Member Name': new['Member Name'].astype(str)}).reindex(
+                      columns=['Member Name'] + columns),
+                  on='Member Name', how='outer', suffixes=(' old', ' new'), indicator=True)
+    df = df.sort_values('Member Name', kind='stable').reset_index(drop=True)
+
+    # members x categories, a missing category counts as zero points
+    old_values = df[[c + ' old' for c in columns]].apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(float)
+    new_values = df[[c + ' new' for c in columns]].apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(float)
+    added = (df['_merge'] == 'right_only').to_numpy()
+    removed = (df['_merge'] == 'left_only').to_numpy()
+    changed = (np.abs(new_values - old_values) >= tolerance) & ~(added | removed)[:, None]
+
+    frames = []
+    total = columns.index('Total') if 'Total' in columns else None
+    for status, rows in (('Added', added), ('Removed', removed)):
+        if total is not None and rows.any():
+            frames.append(pd.DataFrame({
+                'Member Name': df['Member Name'].to_numpy()[rows], 'Status': status, 'Category': 'Total',
+                'Old': np.where(removed[rows], old_values[rows, total], np.nan),
+                'New': np.where(added[rows], new_values[rows, total], np.nan)}))
+    member, category = np.nonzero(changed)
+    frames.append(pd.DataFrame({
+        'Member Name': df['Member Name'].to_numpy()[member], 'Status': 'Changed',
+        'Category': np.array(columns, dtype=object)[category],
+        'Old': old_values[member, category], 'New': new_values[member, category]}))
+    report = pd.concat([f for f in frames if len(f) > 0] or [pd.DataFrame(columns=report_columns)],
+                       ignore_index=True).astype({'Old': float, 'New': float})
+    report['Change'] = (report['New'].fillna(0) - report['Old'].fillna(0)).round(3)
+
+    # added and removed members first, then the changes, in the order of the columns
+    order = {status: n for n, status in enumerate(['Added', 'Removed', 'Changed'])}
+    report['_order'] = report['Status'].map(order)
+    report['_column'] = report['Category'].map({c: n for n, c in enumerate(colnames)})
+    report = report.sort_values(['_order', 'Member Name', '_column'], kind='stable')
+    return report[report_columns].reset_index(drop=True)
+
+
+def comparison_counts(report):
+    # members added, removed and with changed points
+    counts = report.drop_duplicates(['Member Name', 'Status'])['Status'].value_counts()
+    return {status: int(counts.get(status, 0)) for status in ('Added', 'Removed', 'Changed')}
+
+
+def totals(report):
+    # one row per member with a different total
+    return report[report['Category'] == 'Total'].reset_index(drop=True)
+
+
+def write_comparison_report(file_name, report):
+    # xlsx: the members with another total, then all differences
+    if table_format(file_name) is None:
+        write_summary_workbook(file_name, totals(report), 'Totals', report, 'All Differences')
+    else:
+        export_table(file_name, report)
@@ -0,0 +1,226 @@
+# Finding the files to import in a folder and its subfolders
+#
+# The self-reports are often kept in a folder per crew, on a network share. The folder
+# and its subfolders are scanned with os.scandir, keeping the files whose name matches
+# one of the include patterns and none of the exclude patterns; folders matching the
+# exclude_dirs patterns (e.g. 'master file' with the blank template) are not entered.
+# Lock files of open workbooks ('~$name.xlsx', '.~lock.name.xlsx#') are left out.
+#
+# With a manifest, each scan saves the files found (path, size, time changed) and the
+# time each folder changed. The next scan of the same folder only lists the folders that
+# changed since (a file added, removed or saved by Excel, which writes a new file and
+# renames it, changes the time of its folder); for the other folders the files in the
+# manifest are used. On a slow network share this is one request per folder instead of
+# one per file.
+#
+# The folder can also be a zip archive (e.g. the self-reports sent as one attachment).
+# Its files are listed from the archive's directory and named as if the archive were a
+# folder ('reports.zip/Crew A/Smith.xlsx'); they are read from the archive into memory
+# when they are imported (see Archives), so nothing is extracted to the disk.
+
+import io
+import os
+import json
+import time
+import hashlib
+import fnmatch
+import zipfile
+import tempfile
+
+default_manifest_dir = os.path.join(os.path.expanduser('~'), '.losap', 'manifests')
+
+manifest_version = 1
+
+# folders changed less than this many seconds before a scan are listed again at the
+# next scan (a change in the same second does not change the time of the folder)
+settle_seconds = 2
+
+archive_extensions = ('.zip',)
+
+# the member self-reports (see scoring.read_self_report_files)
+self_report_patterns = {
+    'include': ['*.xlsx'],
+    'exclude': ['~*', '.~lock*', '*points tracker master*', '*template*'],
+    'exclude_dirs': ['master file', '.*', '__macosx'],
+}
+
+
+def matches(name, patterns):
+    name = name.lower()
+    return any(fnmatch.fnmatchcase(name, pattern.lower()) for pattern in patterns)
+
+
+def scan(root, patterns, manifest=None):
+    # The files under root matching the patterns, as (path, size, time changed) sorted by
+    # path, and the new manifest. manifest: the manifest of an earlier scan (or None)
+    old = {}
+    if manifest is not None and manifest.get('version') == manifest_version \
+            and manifest.get('patterns') == patterns:
+        old = manifest['dirs']
+    now = time.time_ns()
+    dirs = {}
+    found = []
+    stack = ['']
+    while stack:
+        rel = stack.pop()
+        path = os.path.join(root, rel) if rel else root
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        known = old.get(rel)
+        if known is not None and known['mtime'] == mtime:
+            files, subdirs = known['files'], known['dirs']
+        else:
+            files, subdirs = [], []
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            if not matches(entry.name, patterns['exclude_dirs']):
+                                subdirs.append(entry.name)
+                        elif entry.is_file() and matches(entry.name, patterns['include']) \
+                                and not matches(entry.name, patterns['exclude']):
+                            st = entry.stat()
+                            files.append([entry.name, st.st_size, st.st_mtime_ns])
+                    except OSError:
+                        # e.g. a file removed while scanning
+                        continue
+        recent = now - mtime < settle_seconds * 10 ** 9
+        dirs[rel] = {'mtime': None if recent else mtime, 'files': files, 'dirs': subdirs}
+        found.extend((os.path.join(path, name), size, file_mtime) for name, size, file_mtime in files)
+        stack.extend(os.path.join(rel, name) if rel else name for name in subdirs)
+    found.sort()
+    return found, {'version': manifest_version, 'root': os.path.abspath(root),
+                   'patterns': patterns, 'dirs': dirs}
+
+
+def is_archive(path):
+    return path.lower().endswith(archive_extensions) and os.path.isfile(path)
+
+
+def split_archive_path(path):
+    # (archive, name in the archive) of a file in a zip archive, or (None, path)
+    head, names = path, []
+    while True:
+        if names and is_archive(head):
+            return head, '/'.join(reversed(names))
+        parent, name = os.path.split(head)
+        if not name or parent == head:
+            return None, path
+        names.append(name)
+        head = parent
+
+
+def scan_archive(archive, patterns):
+    # the files in a zip archive matching the patterns, as (path, size, CRC-32) sorted by path
+    found = []
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            *dirs, name = info.filename.rstrip('/').split('/')
+            if matches(name, patterns['include']) and not matches(name, patterns['exclude']) \
+                    and not any(matches(d, patterns['exclude_dirs']) for d in dirs):
+                found.append((os.path.join(archive, *dirs, name), info.file_size, info.CRC))
+    found.sort()
+    return found
+
+
+class Archives:
+    # The zip archives opened while reading files, each opened once:
+    #   with Archives() as archives:
+    #       load_workbook(archives.source(path))
+    def __init__(self):
+        self.archives = {}
+
+    def archive(self, path):
+        if path not in self.archives:
+            self.archives[path] = zipfile.ZipFile(path)
+        return self.archives[path]
+
+    def source(self, path):
+        # the path of a file, or the contents of a file in an archive (in memory)
+        archive, name = split_archive_path(path)
+        if archive is None:
+            return path
+        return io.BytesIO(self.archive(archive).read(name))
+
+    def checksum(self, path):
+        # the size and CRC-32 of a file in an archive, from the archive's directory
+        archive, name = split_archive_path(path)
+        info = self.archive(archive).getinfo(name)
+        return '{}-{:08x}'.format(info.file_size, info.CRC)
+
+    def close(self):
+        for zf in self.archives.values():
+            zf.close()
+        self.archives = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def manifest_file(root, manifest_dir=default_manifest_dir):
+    # one manifest per scanned folder
+    key = hashlib.sha256(os.path.abspath(root).encode()).hexdigest()[:32]
+    return os.path.join(manifest_dir, key + '.json')
+
+
+def load_manifest(file_name):
+    try:
+        with open(file_name, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        # a damaged manifest: the folders are listed again
+        print("Error reading the manifest:", e)
+        return None
+
+
+def save_manifest(file_name, manifest):
+    directory = os.path.dirname(file_name)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, file_name)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+
+def find_files(root, patterns, manifest_dir=None):
+    # the paths of the files under root; with manifest_dir, the manifest of the last scan
+    # of root is used and updated. root can be a zip archive (listed without a manifest)
+    if is_archive(root):
+        found = scan_archive(root, patterns)
+    elif manifest_dir is None:
+        found, _ = scan(root, patterns)
+    else:
+        file_name = manifest_file(root, manifest_dir)
+        found, manifest = scan(root, patterns, load_manifest(file_name))
+        try:
+            save_manifest(file_name, manifest)
+        except OSError as e:
+            print("Error saving the manifest:", e)
+    return [path for path, _, _ in found]
+
+
+def changes(old, new):
+    # files added, removed and changed between two manifests: {'added': [...], ...}
+    def files(manifest):
+        result = {}
+        for rel, entry in (manifest or {}).get('dirs', {}).items():
+            for name, size, mtime in entry['files']:
+                result[os.path.join(rel, name)] = (size, mtime)
+        return result
+    before, after = files(old), files(new)
+    return {'added': sorted(after.keys() - before.keys()),
+            'removed': sorted(before.keys() - after.keys()),
+            'changed': sorted(p for p in after.keys() & before.keys() if after[p] != before[p])}
@@ -0,0 +1,191 @@
+# Export of the results
+#
+# The workbook with a detail sheet per member is written with xlsxwriter in
+# 'constant_memory' mode: each row is flushed to disk as soon as the next row is
+# started, so memory use does not grow with the number of members. Rows therefore have
+# to be written in order, one sheet after the other. The values are converted to Python
+# values chunk_rows rows at a time, so the converted values do not grow with the number
+# of records either. The cell formats are created once and shared by all sheets.
+
+import os
+import math
+import pandas as pd
+import xlsxwriter
+
+# colors used in the exported workbooks
+header_colors = {'bg_color': '#4472c4', 'font_color': 'white'}
+even_row_color = '#d9d9d9'
+odd_row_color = '#FFFFFF'
+
+# rows converted to Python values at a time
+chunk_rows = 10000
+
+# characters Excel does not allow in sheet names
+invalid_sheet_chars = '[]:*?/\\'
+
+
+def sheet_name(name, used):
+    # Excel sheet names: max 31 characters, some characters not allowed, and unique
+    # (case-insensitive)
+    base = ''.join('_' if c in invalid_sheet_chars else c for c in str(name)).strip("'")
+    base = base[:31] or 'Sheet'
+    candidate = base
+    n = 2
+    while candidate.lower() in used:
+        suffix = ' (' + str(n) + ')'
+        candidate = base[:31 - len(suffix)] + suffix
+        n += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def make_formats(workbook):
+    formats = {'header': workbook.add_format(header_colors)}
+    for parity, color in (('even', even_row_color), ('odd', odd_row_color)):
+        formats[parity] = workbook.add_format({'bg_color': color})
+        formats[parity + ' date'] = workbook.add_format({'bg_color': color,
+                                                         'num_format': 'yyyy-mm-dd'})
+    return formats
+
+
+def column_values(series):
+    # Python values for one column (None for blanks, which xlsxwriter cannot write as
+    # NaN/NaT) and the kind of cell to write
+    if pd.api.types.is_datetime64_any_dtype(series):
+        # written as Excel serial numbers with a date format
+        serial = (series - pd.Timestamp('1899-12-30')) / pd.Timedelta(days=1)
+        return [None if v != v else v for v in serial.tolist()], 'date'
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        values = series.astype('float64')
+        if series.dtype == 'float32':
+            # float32 points (see compact.py) without the float64 noise
+            values = values.round(6)
+        values = values.tolist()
+        return [None if v != v or math.isinf(v) else v for v in values], 'number'
+    values = series.astype(object).tolist()
+    return [None if v is None or v != v else str(v) for v in values], 'string'
+
+
+def frame_columns(df, columns=None):
+    return [column_values(df[col]) for col in (df.columns if columns is None else columns)]
+
+
+def write_rows(worksheet, df, formats, start=0, stop=None, columns=None):
+    # write the header and rows start..stop of df (columns: the columns to write, default
+    # all), converting chunk_rows rows at a time
+    header = list(df.columns if columns is None else columns)
+    for col_num, value in enumerate(header):
+        worksheet.write_string(0, col_num, str(value), formats['header'])
+    writers = {'date': worksheet.write_number, 'number': worksheet.write_number,
+               'string': worksheet.write_string}
+    if stop is None:
+        stop = len(df)
+    row_num = 0
+    for first in range(start, stop, chunk_rows):
+        chunk = frame_columns(df.iloc[first:min(first + chunk_rows, stop)], header)
+        for i in range(len(chunk[0][0]) if chunk else 0):
+            row_num += 1
+            parity = 'even' if row_num % 2 == 0 else 'odd'
+            for col_num, (values, kind) in enumerate(chunk):
+                value = values[i]
+                fmt = formats[parity + ' date'] if kind == 'date' else formats[parity]
+                if value is None:
+                    worksheet.write_blank(row_num, col_num, None, fmt)
+                else:
+                    writers[kind](row_num, col_num, value, fmt)
+
+
+# -------------------------------------------------------------------
+# Workbook with the summary followed by one sheet with the records of each member
+
+def write_member_workbook(file_name, summary, provenance, summary_sheet):
+    workbook = xlsxwriter.Workbook(file_name, {'constant_memory': True})
+    try:
+        formats = make_formats(workbook)
+        used = set()
+
+        worksheet = workbook.add_worksheet(sheet_name(summary_sheet, used))
+        worksheet.set_column(0, 0, 25)
+        write_rows(worksheet, summary, formats)
+
+        # each member's sheet is a slice of the records
+        records = provenance.records()
+        header = [c for c in records.columns if c != 'Member Name']
+        for name in summary['Member Name']:
+            rows = provenance.member_rows(name)
+            worksheet = workbook.add_worksheet(sheet_name(name, used))
+            worksheet.set_column(0, 0, 20)
+            worksheet.set_column(2, 2, 12)
+            worksheet.set_column(3, 3, 40)
+            write_rows(worksheet, records, formats, rows.start, rows.stop, header)
+    finally:
+        workbook.close()
+
+
+# -------------------------------------------------------------------
+# Workbook with the summary and (optionally) a sheet with all records, for the command
+# line; written the same way as the workbook above
+
+def write_summary_workbook(file_name, summary, summary_sheet, records=None,
+                           records_sheet='Detail Records'):
+    workbook = xlsxwriter.Workbook(file_name, {'constant_memory': True})
+    try:
+        formats = make_formats(workbook)
+        used = set()
+        worksheet = workbook.add_worksheet(sheet_name(summary_sheet, used))
+        worksheet.set_column(0, 0, 25)
+        write_rows(worksheet, summary, formats)
+        if records is not None:
+            worksheet = workbook.add_worksheet(sheet_name(records_sheet, used))
+            worksheet.set_column(0, 0, 25)
+            worksheet.set_column(3, 3, 12)
+            worksheet.set_column(4, 4, 40)
+            write_rows(worksheet, records, formats)
+    finally:
+        workbook.close()
+
+
+# -------------------------------------------------------------------
+# Data files for other systems (payroll/pension, dashboards)
+#   Written with the pandas bulk writers. The records, when wanted, go to a second
+#   file next to the summary, e.g. '2024-01 Points.csv' and '2024-01 Points records.csv'.
+#   Parquet needs the optional 'pyarrow' (or 'fastparquet') package.
+
+table_formats = {'.csv': 'csv', '.parquet': 'parquet', '.jsonl': 'jsonl'}
+
+
+def plain_frame(df):
+    # float32 points (see compact.py) without the float64 noise
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == 'float32':
+            df[col] = df[col].astype('float64').round(6)
+    return df
+
+
+def write_table(df, file_name, fmt):
+    df = plain_frame(df)
+    if fmt == 'csv':
+        df.to_csv(file_name, index=False)
+    elif fmt == 'parquet':
+        df.to_parquet(file_name, index=False)
+    elif fmt == 'jsonl':
+        df.to_json(file_name, orient='records', lines=True, date_format='iso')
+    else:
+        raise ValueError('Unknown export format: ' + str(fmt))
+
+
+def records_file_name(file_name):
+    stem, ext = os.path.splitext(file_name)
+    return stem + ' records' + ext
+
+
+def table_format(file_name):
+    return table_formats.get(os.path.splitext(file_name)[1].lower())
+
+
+def export_table(file_name, summary, records=None, fmt=None):
+    fmt = fmt or table_format(file_name)
+    write_table(summary, file_name, fmt)
+    if records is not None:
+        write_table(records, records_file_name(file_name), fmt)
@@ -0,0 +1,101 @@
+# Faster reading of large CSV exports (ePCR)
+#
+# When the optional 'pyarrow' package is installed, CSV files are read with the Arrow
+# CSV reader: the file is parsed on several threads, only the columns that are needed
+# are converted, and text columns that repeat (member names) are dictionary encoded,
+# so they arrive in pandas as categoricals with one string per distinct name instead of
+# one Python string per row. Without pyarrow the pandas parser is used; the result is
+# the same.
+#
+# Run this file to compare the two on a generated export, e.g.
+#   python fastcsv.py 500000
+
+import sys
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
+
+engines = ('auto', 'pyarrow', 'pandas')
+
+
+def have_arrow():
+    return pa_csv is not None
+
+
+def read_csv(file_name, columns=None, category_columns=(), engine='auto'):
+    # columns: the columns to read (None: all); category_columns: read as categoricals
+    if engine not in engines:
+        raise ValueError('Unknown CSV engine: ' + str(engine))
+    if engine == 'pyarrow' and not have_arrow():
+        raise ImportError("The 'pyarrow' package is needed to read CSV files with Arrow")
+    if engine == 'pandas' or not have_arrow():
+        df = pd.read_csv(file_name, usecols=columns)
+        for col in category_columns:
+            df[col] = df[col].astype('category')
+        return df
+
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=columns,
+        # every column is read as text (as the pandas parser does with these exports),
+        # the repeating columns dictionary encoded
+        column_types={col: pa.dictionary(pa.int32(), pa.string()) for col in category_columns},
+        strings_can_be_null=True)
+    table = pa_csv.read_csv(file_name, read_options=pa_csv.ReadOptions(use_threads=True),
+                            convert_options=convert_options)
+    return table.to_pandas()
+
+
+# -------------------------------------------------------------------
+# Benchmark
+
+def sample_epcr(file_name, n_rows=100000, n_members=300, seed=0):
+    # an ePCR export with the columns used by the import
+    rng = np.random.default_rng(seed)
+    members = np.array(['First' + str(i) + ' Member' + str(i) for i in range(n_members)], dtype=object)
+    days = pd.to_datetime('2024-01-01') + pd.to_timedelta(rng.integers(0, 366, n_rows), unit='D')
+    # m/d/yyyy as in the export ('%-m' of strftime only works with the GNU C library)
+    dates = days.month.astype(str) + '/' + days.day.astype(str) + '/' + days.year.astype(str)
+    pd.DataFrame({
+        'Incident Date': dates,
+        'Response Incident Number (eResponse.03)': ['E24' + str(i).zfill(6) for i in range(n_rows)],
+        'Incident Crew Member Full Name': members[rng.integers(0, n_members, n_rows)],
+        'Signature EMS Primary Care Provider Full Name List (eOther.21 - eOther.20)':
+            members[rng.integers(0, n_members, n_rows)],
+    }).to_csv(file_name, index=False)
+
+
+def benchmark(n_rows=100000, repeat=3):
+    # seconds to read the file and count the calls per member, per engine
+    from scoring import read_epcr_file
+    results = {}
+    with tempfile.NamedTemporaryFile(suffix='.csv') as f:
+        sample_epcr(f.name, n_rows)
+        for engine in ('pandas', 'pyarrow'):
+            if engine == 'pyarrow' and not have_arrow():
+                continue
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                df = read_epcr_file(f.name, engine)
+                df.groupby('Member Name', observed=True).size()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[engine] = (best, int(df.memory_usage(deep=True).sum()))
+    return results
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print('ePCR rows: ' + str(n))
+    for engine, (seconds, memory) in benchmark(n).items():
+        print('{:8s} {:7.3f} s  {:9,.0f} KB'.format(engine, seconds, memory / 1024))
+    if not have_arrow():
+        print("pyarrow is not installed: only the pandas parser was measured")
@@ -0,0 +1,177 @@
+# Service history: points per member per year, qualifying years and vesting
+#
+# A member earns a year of service credit in a year with at least 50 points (the
+# threshold), and is vested after a number of such years. The history keeps the points
+# of every imported period per member and year (one row per member, year and period,
+# so importing a period again replaces it). The points of a year are the points of
+# its periods added up, with the yearly maxima of point_rules() applied to the sums.
+#
+# The status of all members (points per year, qualifying years, vested, points still
+# needed this year) is calculated in one pass over a member x year table and kept
+# until the history changes, so 'who is vested' and 'who is close to 50 points' are
+# answered from that table.
+#
+# The history is saved as a CSV file, so it can be kept for decades and opened in Excel.
+
+import os
+import numpy as np
+import pandas as pd
+
+from scoring import colnamestoadd, aggregate, point_rules
+
+default_service_rules = {
+    'threshold': 50,        # points needed in a year for a year of service credit
+    'vesting_years': 5,     # qualifying years needed to be vested
+    'close_margin': 10,     # 'close to the threshold': at most this many points short
+}
+
+history_columns = ['Member Name', 'Year', 'Period'] + colnamestoadd
+
+status_columns = ['Member Name', 'Qualifying Years', 'Vested', 'First Year', 'Last Year',
+                  'Points This Year', 'Points Needed']
+
+
+def make_service_rules(rules=None):
+    merged = dict(default_service_rules)
+    merged.update(rules or {})
+    return merged
+
+
+def year_points(frames, rules=None):
+    # Points per member per year of the records of a session (source kind -> records,
+    # see importers.py); the records of each year are scored separately. Records
+    # without a date (the self-reported signups and calls) do not count
+    frames = {kind: df for kind, df in frames.items() if len(df) > 0}
+    years = set()
+    for df in frames.values():
+        years.update(pd.to_datetime(df['Date']).dt.year.dropna().astype(int).unique())
+    results = []
+    for year in sorted(years):
+        in_year = {kind: df[pd.to_datetime(df['Date']).dt.year == year] for kind, df in frames.items()}
+        summary, _ = aggregate(in_year, rules)
+        summary['Year'] = year
+        results.append(summary)
+    if not results:
+        return pd.DataFrame(columns=['Member Name', 'Year'] + colnamestoadd)
+    return pd.concat(results, ignore_index=True)[['Member Name', 'Year'] + colnamestoadd]
+
+
+class ServiceHistory:
+    def __init__(self, rules=None, scoring_rules=None):
+        self.rules = make_service_rules(rules)
+        self.scoring_rules = scoring_rules
+        self.points = pd.DataFrame(columns=history_columns)
+        self._years = None
+        self._status = None
+
+    # ---------------------------------------------------------------
+    # Adding periods, saving and opening
+
+    def add_period(self, period, frames):
+        # the points of the records of one period (source kind -> records); a period that
+        # was added before is replaced
+        df = year_points(frames, self.scoring_rules)
+        df.insert(2, 'Period', str(period))
+        kept = self.points[self.points['Period'] != str(period)]
+        self.points = pd.concat([kept, df], ignore_index=True) if len(kept) else df
+        self._changed()
+        return df
+
+    def remove_period(self, period):
+        self.points = self.points[self.points['Period'] != str(period)].reset_index(drop=True)
+        self._changed()
+
+    def periods(self):
+        return sorted(self.points['Period'].astype(str).unique())
+
+    def _changed(self):
+        self._years = None
+        self._status = None
+
+    def save(self, file_name):
+        self.points.to_csv(file_name, index=False)
+
+    @classmethod
+    def load(cls, file_name, rules=None, scoring_rules=None):
+        history = cls(rules, scoring_rules)
+        if os.path.exists(file_name):
+            df = pd.read_csv(file_name, dtype={'Member Name': str, 'Period': str})
+            history.points = df.reindex(columns=history_columns).fillna({c: 0 for c in colnamestoadd})
+        return history
+
+    # ---------------------------------------------------------------
+    # Aggregates
+
+    def years(self):
+        # member x year table of the points of each year
+        if self._years is None:
+            table = point_rules(self.scoring_rules)
+            df = self.points.groupby(['Member Name', 'Year'])[colnamestoadd].sum()
+            # the yearly maxima apply to the points of the whole year
+            for col in colnamestoadd:
+                maximum = table.get(col, {}).get('max')
+                if maximum is not None:
+                    df[col] = df[col].clip(upper=maximum)
+            totals = df[colnamestoadd].sum(axis=1).round(2)
+            self._years = totals.unstack('Year').fillna(0)
+            self._years.columns = self._years.columns.astype(int)
+        return self._years
+
+    def status(self, year=None):
+        # one row per member: qualifying years, vested, and the points of the given year
+        # (default: the last year in the history)
+        if self._status is None or year is not None:
+            status = self._make_status(year)
+            if year is not None:
+                return status
+            self._status = status
+        return self._status
+
+    def _make_status(self, year=None):
+        years = self.years()
+        if years.empty:
+            return pd.DataFrame(columns=status_columns)
+        values = years.to_numpy()
+        columns = years.columns.to_numpy()
+        year = columns.max() if year is None else year
+        qualifying = values >= self.rules['threshold']
+        has_points = values > 0
+        this_year = years[year].to_numpy() if year in years.columns else np.zeros(len(years))
+
+        # first and last year with points (0 when none)
+        first = np.where(has_points.any(axis=1), columns[has_points.argmax(axis=1)], 0)
+        last = np.where(has_points.any(axis=1),
+                        columns[len(columns) - 1 - has_points[:, ::-1].argmax(axis=1)], 0)
+        status = pd.DataFrame({
+            'Member Name': years.index.astype(str),
+            'Qualifying Years': qualifying.sum(axis=1),
+            'First Year': first,
+            'Last Year': last,
+            'Points This Year': this_year,
+            'Points Needed': np.clip(self.rules['threshold'] - this_year, 0, None).round(2),
+        })
+        status['Vested'] = status['Qualifying Years'] >= self.rules['vesting_years']
+        return status[status_columns]
+
+    # ---------------------------------------------------------------
+    # Questions
+
+    def vested(self):
+        status = self.status()
+        return status[status['Vested']].reset_index(drop=True)
+
+    def close_to_threshold(self, year=None, margin=None):
+        # members who have not reached the threshold this year, but are close
+        margin = self.rules['close_margin'] if margin is None else margin
+        status = self.status(year)
+        close = (status['Points Needed'] > 0) & (status['Points Needed'] <= margin)
+        return status[close].sort_values('Points Needed', kind='stable').reset_index(drop=True)
+
+    def member(self, name):
+        # the points of each year of one member
+        years = self.years()
+        if name not in years.index:
+            return pd.DataFrame(columns=['Year', 'Points', 'Qualifying'])
+        points = years.loc[name]
+        return pd.DataFrame({'Year': points.index, 'Points': points.to_numpy(),
+                             'Qualifying': points.to_numpy() >= self.rules['threshold']})
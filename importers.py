@@ -0,0 +1,234 @@
+# Importers: one per kind of data source
+#
+# An importer reads the files of one source and produces records in one common form
+# (see provenance.input_columns):
+#
+#   Member Name   'Last, First'
+#   Category      the summary column the record counts for ('Tour of Duty', 'Meetings', ...)
+#   Quantity      hours, calls, attendances or points (see scoring.point_rules)
+#   Date          date of the shift, call or activity
+#   Source, Row   the file and row the record was read from
+#
+# read() yields the records as one or more frames. Importer is an abstract class, so
+# an importer without read() fails when it is created rather than during an import.
+# The session (see session.py) takes care of the rest for every importer in the same
+# way: caching, keeping the records, calculating the points of all sources at once and
+# the provenance of the points.
+#
+# A new source is added by registering an importer, e.g. for a CSV file exported by a
+# training system:
+#
+#   register_importer(CsvImporter('LMS', 'Training', member_column='Student',
+#                                 date_column='Completed', quantity_column='Hours'))
+
+import os
+from abc import ABC, abstractmethod
+import pandas as pd
+
+from compact import map_names, compact_activities
+from validation import validate_activities
+from discovery import archive_extensions
+from provenance import excel_dates, make_input
+from scoring import (fix_name_order, swap_name_order, read_iamresponding_file,
+                     read_epcr_file, self_report_files, read_self_report_files)
+
+
+class Importer(ABC):
+    kind = None             # name of the source, e.g. 'IAR'
+    reader_keys = []        # the settings that change what is read from the files
+    period_folder = None    # folder of this source in a period folder (see period_paths)
+    extensions = ()         # file types looked for in that folder
+
+    def find_files(self, path):
+        # the files to read for a file or folder chosen by the user
+        return path
+
+    def find_in_folder(self, folder):
+        # the file or folder to import from the folder of this source in a period folder,
+        # or None: the most recently changed file of the right type
+        files = [entry for entry in os.scandir(folder) if entry.is_file()
+                 and entry.name.lower().endswith(self.extensions)
+                 and not entry.name.startswith('~')]
+        if not files:
+            return None
+        return max(files, key=lambda entry: entry.stat().st_mtime).path
+
+    @abstractmethod
+    def read(self, files, settings, progress=None, problems=None, failed=None):
+        # Yields frames of records. problems: list to add frames of data validation
+        # problems to (see validation.py). failed: list to add (file, reason) to for the
+        # files that cannot be read, when the other files of the source can still be used.
+        # Every importer has its own; an importer without it cannot be created
+        ...
+
+
+importer_registry = {}
+
+
+def register_importer(importer):
+    # registering an importer with the same kind replaces it
+    importer_registry[importer.kind] = importer
+    return importer
+
+
+def get_importer(kind):
+    return importer_registry[kind]
+
+
+def period_paths(folder):
+    # source kind -> the file or folder to import, for the sources found in a period
+    # folder laid out as
+    #   <folder>/iamresponding/                 the 'I am responding' report
+    #   <folder>/ePCR/                          the ePCR export
+    #   <folder>/user reported spreadsheets/    the member self-reports
+    paths = {}
+    for kind, importer in importer_registry.items():
+        if importer.period_folder is None:
+            continue
+        source_folder = os.path.join(folder, importer.period_folder)
+        if os.path.isdir(source_folder):
+            path = importer.find_in_folder(source_folder)
+            if path is not None:
+                paths[kind] = path
+    return paths
+
+
+class IarImporter(Importer):
+    # 'I am responding' report: one record per shift, with the shift hours
+    kind = 'IAR'
+    reader_keys = ['iamr_rows_to_skip', 'iamr_rows_end']
+    period_folder = 'iamresponding'
+    extensions = ('.xls', '.xlsb', '.xlsx')
+
+    def read(self, files, settings, progress=None, problems=None, failed=None):
+        df = read_iamresponding_file(files, settings['iamr_rows_to_skip'], settings['iamr_rows_end'])
+        # the start and end of each shift are kept as well
+        start = pd.to_numeric(df['Start date'], errors='coerce') + pd.to_numeric(df['Start time'], errors='coerce')
+        end = pd.to_numeric(df['End date'], errors='coerce') + pd.to_numeric(df['End time'], errors='coerce')
+        yield make_input(df['Member Name'].to_numpy(), 'Tour of Duty', df['Shift hours'].to_numpy(),
+                         excel_dates(df['Start date']).to_numpy(), df['Source'].to_numpy(),
+                         df['Row'].to_numpy(),
+                         Start=pd.to_datetime(start, unit='D', origin='1899-12-30').dt.round('s').to_numpy(),
+                         End=pd.to_datetime(end, unit='D', origin='1899-12-30').dt.round('s').to_numpy())
+
+
+class EpcrImporter(Importer):
+    # ePCR export: one record per call, per crew member
+    kind = 'ePCR'
+    period_folder = 'ePCR'
+    extensions = ('.csv',)
+
+    def read(self, files, settings, progress=None, problems=None, failed=None):
+        df = read_epcr_file(files, settings.get('epcr_engine', 'auto'))
+        yield make_input(df['Member Name'].to_numpy(), 'Calls Responded To', 1.0,
+                         excel_dates(df['Incident Date']).to_numpy(), df['Source'].to_numpy(),
+                         df['Row'].to_numpy(),
+                         Incident=df['Response Incident Number (eResponse.03)'].to_numpy())
+
+
+class SelfReportImporter(Importer):
+    # Member self-reports: one record per activity, plus the self-reported signup hours
+    # and calls of each member
+    kind = 'Self-reports'
+    reader_keys = ['losap_sheet', 'losap_name_pos', 'losap_SR_Signups', 'losap_SR_Calls',
+                   'losap_rows_to_skip', 'validation_rules']
+    period_folder = 'user reported spreadsheets'
+    manifest_dir = None     # folder with the manifests of earlier scans (see discovery.py)
+
+    # Activity -> (category, column with the quantity); None: one per activity
+    activity_categories = {
+        'Meetings':        ('Meetings', None),
+        'Training Course': ('Training', 'Hours'),
+        'Drills, CMEs':    ('Drills', 'Points'),
+        'Miscellaneous':   ('Misc. Activity', 'Points'),
+        'Disability':      ('Disability', 'Points'),
+    }
+
+    def find_files(self, path):
+        return self_report_files(path, self.manifest_dir)
+
+    def find_in_folder(self, folder):
+        # the folder, or the zip archive in it when it has only the archive
+        if self.find_files(folder):
+            return folder
+        archives = [entry for entry in os.scandir(folder) if entry.is_file()
+                    and entry.name.lower().endswith(archive_extensions)]
+        if not archives:
+            return None
+        return max(archives, key=lambda entry: entry.stat().st_mtime).path
+
+    def read(self, files, settings, progress=None, problems=None, failed=None):
+        df_losap, df_losapSR = read_self_report_files(files, settings, progress, failed)
+        if df_losap.shape[0] == 0:
+            return
+        # the checks need the values as they are in the spreadsheets
+        if problems is not None:
+            problems.append(validate_activities(df_losap, settings.get('validation_rules'),
+                                                fix_name_order))
+
+        # member names and activities as categoricals, hours and points as float32
+        # Swap the first and last names if needed
+        df_losap = swap_name_order(compact_activities(df_losap))
+        df_losapSR = swap_name_order(df_losapSR)
+
+        # Rows with an undefined or unknown Activity are left out; the hours are kept
+        # with each activity (see 'drill_hours' in scoring.py)
+        for activity, (category, column) in self.activity_categories.items():
+            rows = df_losap[df_losap['Activity'] == activity]
+            quantity = 1.0 if column is None else rows[column].to_numpy()
+            yield make_input(rows['Member Name'].to_numpy(), category, quantity,
+                             rows['Date'].to_numpy(), rows['Source'].to_numpy(),
+                             rows['Row'].to_numpy(), Hours=rows['Hours'].to_numpy())
+
+        # the self-reported signup hours and calls (not part of the total)
+        for category, row in (('SR_Signup', 'Signup Row'), ('SR_Calls', 'Calls Row')):
+            quantity = pd.to_numeric(df_losapSR[category], errors='coerce').fillna(0)
+            yield make_input(df_losapSR['Member Name'].to_numpy(), category, quantity.to_numpy(),
+                             pd.NaT, df_losapSR['Source'].to_numpy(), df_losapSR[row].to_numpy())
+
+
+class CsvImporter(Importer):
+    # A CSV file with one row per record, e.g. an export of a CAD or training system.
+    # The names are put in 'Last, First' order; without quantity_column each row counts
+    # as one (e.g. one call)
+    def __init__(self, kind, category, member_column, date_column, quantity_column=None):
+        self.kind = kind
+        self.category = category
+        self.member_column = member_column
+        self.date_column = date_column
+        self.quantity_column = quantity_column
+
+    def read(self, files, settings, progress=None, problems=None, failed=None):
+        # one file or a list of files (e.g. one export per month); a file that cannot be
+        # read is added to failed, and the other files are still read
+        if isinstance(files, str):
+            files = [files]
+        for n, file_name in enumerate(files, start=1):
+            try:
+                records = self.read_file(file_name)
+            except Exception as e:
+                if failed is None:
+                    raise
+                print("Error reading " + os.path.basename(file_name) + ":", e)
+                failed.append((file_name, str(e) or type(e).__name__))
+            else:
+                yield records
+            if progress is not None and progress(n) is False:
+                break
+
+    def read_file(self, file_name):
+        df = pd.read_csv(file_name)
+        names = map_names(df[self.member_column].astype(str), fix_name_order)
+        if self.quantity_column is None:
+            quantity = 1.0
+        else:
+            quantity = pd.to_numeric(df[self.quantity_column], errors='coerce').to_numpy()
+        # row 1 of the csv file is the header
+        return make_input(names.to_numpy(), self.category, quantity,
+                          excel_dates(df[self.date_column]).to_numpy(),
+                          os.path.basename(file_name), df.index.to_numpy() + 2)
+
+
+register_importer(IarImporter())
+register_importer(EpcrImporter())
+register_importer(SelfReportImporter())
@@ -0,0 +1,281 @@
+# Command line version of the LOSAP Points Calculator
+#
+# Imports the same three sources as the main window and writes the summary without
+# the user interface, e.g.
+#
+#   python losap_cli.py --iar iamresponding/Report.xls \
+#                       --epcr ePCR/export.csv \
+#                       --self-reports "user reported spreadsheets" \
+#                       --output "2024-01 Points.csv" --records
+#
+# The output format follows the file extension (.xlsx, .csv, .parquet or .jsonl) or
+# can be given with --format.
+
+import os
+import sys
+import json
+import argparse
+import warnings
+import pandas as pd
+
+from session import Session
+from cache import ResultCache, default_cache_dir
+from importers import get_importer
+from discovery import default_manifest_dir
+from export import (export_table, table_format, write_summary_workbook,
+                    write_member_workbook)
+from validation import write_anomaly_report
+from history import ServiceHistory, default_service_rules
+from statements import write_statements, statement_formats
+from overlap import overlap_report, overlaps, calls_in_shift, write_overlap_report
+from scenarios import ScenarioSimulator, example_scenarios, load_scenarios, write_scenario_report
+from compare import load_summary, compare_summaries, comparison_counts, write_comparison_report
+from reconcile import default_tolerances, reconcile, discrepancies, write_reconciliation_report
+from provenance import dated_between
+from scoring import default_settings
+
+# supress future warnings
+pd.set_option('future.no_silent_downcasting', True)
+warnings.simplefilter(action='ignore', category=FutureWarning)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="LOSAP Points Calculator")
+    parser.add_argument('--iar', help="'I am responding' report (xls)")
+    parser.add_argument('--epcr', help="ePCR report (csv)")
+    parser.add_argument('--self-reports', help="folder or zip file with the member self-reports (xlsx)")
+    parser.add_argument('--period',
+                        help="folder with the iamresponding, ePCR and 'user reported spreadsheets' "
+                             "folders; the three sources are read at the same time")
+    parser.add_argument('-o', '--output', required=True, help="file to write the results to")
+    parser.add_argument('--format', choices=['xlsx', 'csv', 'parquet', 'jsonl'],
+                        help="output format (default: from the file extension)")
+    parser.add_argument('--records', action='store_true',
+                        help="also write every record that contributed points")
+    parser.add_argument('--member-sheets', action='store_true',
+                        help="xlsx only: add a sheet with the records of each member")
+    parser.add_argument('--anomalies', help="write the data validation report to this file")
+    parser.add_argument('--validation-rules',
+                        help="json file with validation rules (see validation.py)")
+    parser.add_argument('--reconciliation',
+                        help="write the self-reported vs. IAR/ePCR comparison to this file")
+    parser.add_argument('--tolerance-abs', type=float, default=default_tolerances['absolute'],
+                        help="reconciliation: allowed difference in points")
+    parser.add_argument('--tolerance-rel', type=float, default=default_tolerances['relative'],
+                        help="reconciliation: allowed difference as a fraction")
+    parser.add_argument('--overlaps',
+                        help="write the calls and self-reported activities during IAR shifts to this file")
+    parser.add_argument('--compare-with',
+                        help="compare the points with an earlier summary (.losap session, or an "
+                             "exported xlsx, csv, parquet or jsonl file)")
+    parser.add_argument('--comparison',
+                        help="write the members added and removed and the points changed since "
+                             "--compare-with to this file")
+    parser.add_argument('--what-if',
+                        help="write the total points and qualifying members under other scoring "
+                             "rules to this file (see scenarios.py)")
+    parser.add_argument('--scenarios',
+                        help="json file with the scenarios for --what-if: name -> scoring rules "
+                             "(default: the example scenarios)")
+    parser.add_argument('--scoring-rules',
+                        help="json file with scoring rules (see default_rules in scoring.py)")
+    parser.add_argument('--session',
+                        help="calculate from a saved session instead of (or in addition to) the files")
+    parser.add_argument('--save-session',
+                        help="save the rows read from the files to this session file")
+    parser.add_argument('--cache-dir', default=default_cache_dir,
+                        help="folder with the rows read before (default: %(default)s)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always read the files")
+    parser.add_argument('--clear-cache', action='store_true',
+                        help="remove all rows read before from the cache first")
+    parser.add_argument('--from', dest='date_from',
+                        help="only the points of the records on or after this date (YYYY-MM-DD)")
+    parser.add_argument('--to', dest='date_to',
+                        help="only the points of the records up to this date (YYYY-MM-DD)")
+    parser.add_argument('--by',
+                        help="the points of each month (M), quarter (Q), year (Y) or fiscal year "
+                             "(e.g. Y-JUN), one after the other")
+    parser.add_argument('--statements',
+                        help="write a statement for each member to this folder")
+    parser.add_argument('--statement-format', choices=statement_formats, default='pdf',
+                        help="format of the statements (default: %(default)s)")
+    parser.add_argument('--statement-period',
+                        help="period shown on the statements (default: the output file name)")
+    parser.add_argument('--history',
+                        help="service history file (csv): add the points of this period to it")
+    parser.add_argument('--history-period',
+                        help="name of the period in the service history (default: the output file name)")
+    parser.add_argument('--history-report',
+                        help="write the qualifying years and vesting of every member to this file "
+                             "(csv, parquet or jsonl)")
+    parser.add_argument('--threshold', type=float, default=default_service_rules['threshold'],
+                        help="points needed in a year for a year of service credit")
+    parser.add_argument('--vesting-years', type=int, default=default_service_rules['vesting_years'],
+                        help="qualifying years needed to be vested")
+    parser.add_argument('--manifest-dir', default=default_manifest_dir,
+                        help="folder with the lists of self-report files found before, so only "
+                             "changed folders are listed again (default: %(default)s)")
+    parser.add_argument('--no-manifest', action='store_true',
+                        help="always list all self-report folders")
+    parser.add_argument('--worksheet', default='Points Summary',
+                        help="name of the summary worksheet (xlsx)")
+
+    # reader settings, as in the Settings dialog
+    parser.add_argument('--iar-rows-to-skip', type=int, default=default_settings['iamr_rows_to_skip'])
+    parser.add_argument('--iar-rows-end', type=int, default=default_settings['iamr_rows_end'])
+    parser.add_argument('--sheet', default=default_settings['losap_sheet'])
+    parser.add_argument('--name-pos', default=default_settings['losap_name_pos'])
+    parser.add_argument('--signups-pos', default=default_settings['losap_SR_Signups'])
+    parser.add_argument('--calls-pos', default=default_settings['losap_SR_Calls'])
+    parser.add_argument('--rows-to-skip', type=int, default=default_settings['losap_rows_to_skip'])
+    parser.add_argument('--epcr-engine', choices=['auto', 'pyarrow', 'pandas'],
+                        default=default_settings['epcr_engine'],
+                        help="CSV parser for the ePCR report (auto: pyarrow when installed)")
+    return parser.parse_args(argv)
+
+
+def reader_settings(args):
+    return {'iamr_rows_to_skip': args.iar_rows_to_skip,
+            'iamr_rows_end': args.iar_rows_end,
+            'losap_sheet': args.sheet,
+            'losap_name_pos': args.name_pos,
+            'losap_SR_Signups': args.signups_pos,
+            'losap_SR_Calls': args.calls_pos,
+            'losap_rows_to_skip': args.rows_to_skip,
+            'epcr_engine': args.epcr_engine}
+
+
+def calculate(args, session):
+    settings = reader_settings(args)
+    session.validation_rules = read_json(args.validation_rules)
+    if args.period:
+        for kind, problem in session.import_period(args.period, settings).items():
+            print(kind + ": " + problem)
+    if args.iar:
+        session.read_source('IAR', args.iar, settings)
+    if args.epcr:
+        session.read_source('ePCR', args.epcr, settings)
+    if args.self_reports:
+        files = get_importer('Self-reports').find_files(args.self_reports)
+        session.read_source('Self-reports', files, settings)
+    if args.scoring_rules:
+        summary = session.set_rules(read_json(args.scoring_rules))
+    else:
+        summary = session.rescore()
+    # points of a date range or per period, from the records by date (see timeline.py)
+    if args.by:
+        return session.timeline().by_period(args.by, args.date_from, args.date_to)
+    if args.date_from or args.date_to:
+        return session.timeline().totals(args.date_from, args.date_to)
+    return summary
+
+
+def read_json(file_name):
+    if not file_name:
+        return None
+    with open(file_name) as f:
+        return json.load(f)
+
+
+def update_history(args, frames, scoring_rules):
+    rules = {'threshold': args.threshold, 'vesting_years': args.vesting_years}
+    history = ServiceHistory.load(args.history, rules, scoring_rules)
+    period = args.history_period or os.path.splitext(os.path.basename(args.output))[0]
+    history.add_period(period, frames)
+    history.save(args.history)
+    status = history.status()
+    print(str(int(status['Vested'].sum())) + " of " + str(len(status)) + " members vested, "
+          + str(len(history.close_to_threshold())) + " close to " + '{:g}'.format(args.threshold)
+          + " points this year")
+    if args.history_report:
+        export_table(args.history_report, status, fmt=table_format(args.history_report) or 'csv')
+
+
+def write_output(args, df, provenance):
+    fmt = args.format or table_format(args.output) or 'xlsx'
+    records = provenance.records() if args.records else None
+    if fmt == 'xlsx':
+        if args.member_sheets:
+            write_member_workbook(args.output, df, provenance, args.worksheet)
+        else:
+            write_summary_workbook(args.output, df, args.worksheet, records)
+    else:
+        export_table(args.output, df, records, fmt)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    if not (args.iar or args.epcr or args.self_reports or args.period or args.session):
+        print("Nothing to import: use --period, --iar, --epcr, --self-reports and/or --session")
+        return 2
+    if args.by and (args.statements or args.reconciliation or args.compare_with or args.member_sheets):
+        # these need one row per member, --by gives one per member and period
+        print("--by cannot be used with --statements, --reconciliation, --compare-with or --member-sheets")
+        return 2
+    cache = None if args.no_cache else ResultCache(args.cache_dir)
+    get_importer('Self-reports').manifest_dir = None if args.no_manifest else args.manifest_dir
+    if args.clear_cache:
+        ResultCache(args.cache_dir).clear()
+    session = Session.load(args.session, cache) if args.session else Session(cache=cache)
+    df = calculate(args, session)
+    provenance = session.provenance
+    frames = session.frames
+    anomalies = session.anomalies
+    if args.by or args.date_from or args.date_to:
+        # the records behind the points of the date range, for all reports
+        provenance = provenance.between(args.date_from, args.date_to)
+        frames = {kind: dated_between(df, args.date_from, args.date_to) for kind, df in frames.items()}
+        anomalies = dated_between(anomalies, args.date_from, args.date_to)
+    if args.save_session:
+        session.save(args.save_session)
+    for kind, file_name, reason in session.failed_files():
+        print(kind + ": could not read " + file_name + ": " + reason)
+    report = anomalies
+    if len(report) > 0:
+        print(str(len(report)) + " problems found in the self-reported activities")
+    if args.anomalies:
+        write_anomaly_report(args.anomalies, report)
+    if args.reconciliation:
+        report = reconcile(df, provenance.records(), {'absolute': args.tolerance_abs,
+                                                      'relative': args.tolerance_rel})
+        print(str(len(discrepancies(report))) + " differences between self-reports and IAR/ePCR")
+        write_reconciliation_report(args.reconciliation, report)
+    if args.overlaps:
+        report = overlap_report(frames)
+        in_shift, calls = calls_in_shift(report)
+        print(str(len(overlaps(report))) + " self-reported activities on an IAR shift, "
+              + str(in_shift) + " of " + str(calls) + " calls during a shift")
+        write_overlap_report(args.overlaps, report)
+    if args.compare_with:
+        report = compare_summaries(load_summary(args.compare_with, args.worksheet), df)
+        counts = comparison_counts(report)
+        print(str(counts['Added']) + " members added, " + str(counts['Removed']) + " removed and "
+              + str(counts['Changed']) + " with other points since " + args.compare_with)
+        if args.comparison:
+            write_comparison_report(args.comparison, report)
+    if args.what_if:
+        scenarios = load_scenarios(args.scenarios) if args.scenarios else example_scenarios
+        summary, totals = ScenarioSimulator(frames, session.rules).compare(scenarios, args.threshold)
+        for row in summary.itertuples(index=False):
+            print('{}: {:g} points ({:+g}), {} qualifying members ({:+d})'.format(
+                row[0], row[2], row[5], row[4], row[6]))
+        write_scenario_report(args.what_if, summary, totals)
+    if args.statements:
+        period = args.statement_period or os.path.splitext(os.path.basename(args.output))[0]
+        files = write_statements(args.statements, df, provenance, args.statement_format, period=period)
+        print(str(len(files)) + " statements written to " + args.statements)
+    if args.history:
+        update_history(args, frames, session.rules)
+    try:
+        write_output(args, df, provenance)
+    except ImportError as e:
+        # e.g. Parquet without pyarrow
+        print(e)
+        return 1
+    print(str(len(df)) + " members written to " + args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
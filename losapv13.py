@@ -6,17 +6,34 @@ import sys
 import os
 import warnings
 import uuid
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from openpyxl import load_workbook 
 from openpyxl.styles import PatternFill, Font
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTableView, 
                              QAction, QFileDialog, QTextBrowser,
-                             QDialog, QProgressDialog, QMessageBox)
-from PyQt5.QtCore import QAbstractTableModel, Qt, QUrl, QSettings
+                             QDialog, QProgressDialog, QMessageBox,
+                             QWidget, QVBoxLayout, QLineEdit, QInputDialog)
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt, QUrl, QSettings, QTimer
 
 # user-defined classes in external files
 from settings_ui import Ui_Settings
 from agreement import Ui_Agreement_Dialog
+from session import Session
+from importers import get_importer
+from discovery import default_manifest_dir
+from cache import ResultCache
+from search import MemberIndex
+from history import ServiceHistory
+from export import write_member_workbook, export_table, table_format
+from validation import write_anomaly_report
+from reconcile import reconcile, discrepancies, write_reconciliation_report
+from statements import write_statements
+from overlap import overlap_report, overlaps, calls_in_shift, write_overlap_report
+from scenarios import ScenarioSimulator, example_scenarios, load_scenarios
+from compare import load_summary, compare_summaries, comparison_counts
+from scoring import colnames, colnamestoadd, empty_summary, self_report_files
 
 __author__      = "William A Coetzee"
 __copyright__   = "Copyright Reserved"
@@ -39,41 +56,56 @@ __debuggingsettings__  = False
 pd.set_option('future.no_silent_downcasting', True)
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
-def swap_name_order(df_def):
-    # There appear to be two versions of the spreadsheet out there. In some, names are 
-    # entered as "Last, First" and in others, names are the the form of "First Last"
-    # Let's try to rectify this by assuming that a name field containing a comma is in the
-    # corerct form. If not, then we will swap the two name entries and add a comma
-    # **TODO: Distribute a spreadsheet with names in the form: "Last, First"
-    for i in range(len(df_def)):
-        fname = df_def.loc[i, "Member Name"].rstrip()
-        if (fname.find(',') > 0):
-            df_def.loc[i, "Temp name"] = fname
-        else:
-            # Reverse first and last names 
-            new = fname.rsplit(" ",1) 
-            df_def.loc[i, "Temp name"] =  new[1] + ', ' + new[0] 
-
-    # Delete the 'Full name' column and rename the 'Temp name' column 
-    df_def = df_def.drop(columns=['Member Name'], axis=1)
-    df_def = df_def.rename(columns={"Temp name": "Member Name"})
-    return (df_def)
-
 class PandasModel(QAbstractTableModel):
-    def __init__(self, data):
+    # The rows are shown in chunks: the view asks for more rows (fetchMore) when it is
+    # scrolled to the end. The text of a chunk is made from the frame when the view
+    # first shows one of its rows, and only the last few chunks looked at are kept, so
+    # a large table (all records of a year) takes little more memory than the frame
+    # it shows, however far it is scrolled. The frame itself is not copied.
+    def __init__(self, data, chunk_size=500, cached_chunks=8):
         super(PandasModel, self).__init__()
         self._data = data
+        self._chunk_size = chunk_size
+        self._cached_chunks = cached_chunks
+        self._row_count = min(chunk_size, len(data.index))     # rows fetched so far
+        self._chunks = OrderedDict()    # chunk number -> text of its rows, last used last
+
+    def _row(self, row):
+        n = row // self._chunk_size
+        chunk = self._chunks.get(n)
+        if chunk is None:
+            start = n * self._chunk_size
+            chunk = [[str(value) for value in values] for values in
+                     self._data.iloc[start:start + self._chunk_size].itertuples(index=False, name=None)]
+            self._chunks[n] = chunk
+            if len(self._chunks) > self._cached_chunks:
+                self._chunks.popitem(last=False)
+        else:
+            self._chunks.move_to_end(n)
+        return chunk[row - n * self._chunk_size]
 
     def rowCount(self, parent=None):
-        return len(self._data.index)
+        return self._row_count
 
     def columnCount(self, parent=None):
         return self._data.columns.size
 
+    def canFetchMore(self, parent=QModelIndex()):
+        return self._row_count < len(self._data.index)
+
+    def fetchMore(self, parent=QModelIndex()):
+        start = self._row_count
+        n = min(self._chunk_size, len(self._data.index) - start)
+        if n <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), start, start + n - 1)
+        self._row_count += n
+        self.endInsertRows()
+
     def data(self, index, role=Qt.DisplayRole):
         if index.isValid():
             if role == Qt.DisplayRole:
-                return str(self._data.iloc[index.row(), index.column()])
+                return self._row(index.row())[index.column()]
         return None
 
     def headerData(self, section, orientation, role=Qt.DisplayRole):
@@ -106,6 +138,16 @@ class ManualWindow(QMainWindow):
         self.central_widget.setOpenExternalLinks(True)
         self.central_widget.setSource(QUrl.fromLocalFile(os.path.abspath("About LOSAP Points Calculator.htm")))
 
+class RecordsWindow(QMainWindow):
+    def __init__(self, title, records):
+        super(RecordsWindow, self).__init__()
+        self.setWindowTitle(title)
+        self.setGeometry(150, 150, 900, 500)
+        self.central_widget = QTableView()
+        self.setCentralWidget(self.central_widget)
+        self.model = PandasModel(records)
+        self.central_widget.setModel(self.model)
+
 #class SettingsDialog(QDialog):
     #print("test")
 
@@ -127,19 +169,39 @@ class MainWindow(QMainWindow):
             pass   
 
         self.table_view = QTableView()  
-        self.setCentralWidget(self.table_view)
-
-        # variables
-        #self.colnames = ["Member Name", "Training", "Drills", "Meetings", "Tour of Duty", 
-        #                 "Misc. Activity", "Calls Responded To", "Position Held", "Disability", 
-        #                 "Total", "SR_Signup", "SR_Calls", "SR_Total"]
-        self.colnames = ["Member Name", "Training", "Drills", "Meetings", "Tour of Duty", 
-                         "Misc. Activity", "Calls Responded To", "Position Held", "Disability", 
-                         "Total", "SR_Total"]
-        self.colnamestoadd = ["Training", "Drills", "Meetings", "Tour of Duty", 
-                         "Misc. Activity", "Calls Responded To", "Position Held", "Disability"]
-        self.original_df = pd.DataFrame(columns=self.colnames)
+
+        # search box above the table: names and conditions such as 'Total < 50'
+        # (see search.py)
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search: name, Total < 50, Meetings >= 2")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.textChanged.connect(self.filter_table)
+
+        central_widget = QWidget()
+        layout = QVBoxLayout(central_widget)
+        layout.addWidget(self.search_box)
+        layout.addWidget(self.table_view)
+        self.setCentralWidget(central_widget)
+        
+        # double-click on a member to see the records behind the points
+        self.table_view.doubleClicked.connect(self.open_member_records)
+
+        # variables (the columns are defined in scoring.py)
+        self.colnames = colnames
+        self.colnamestoadd = colnamestoadd
+        self.original_df = empty_summary()
         self.df = self.original_df.copy()
+        
+        # the rows read from the imported files, kept so the points can be calculated
+        # again without reading the files (see session.py). Files that were read
+        # before with the same settings are taken from the cache (see cache.py)
+        self.session = Session(cache=ResultCache())
+
+        # the self-report folders are scanned again only where they changed (see discovery.py)
+        get_importer('Self-reports').manifest_dir = default_manifest_dir
+
+        # every record that contributed points (file, row, date, category, points)
+        self.provenance = self.session.provenance
 
         # I am responding
         self.iamr_rows_to_skip = 2  # Skip this number of rows before reading data
@@ -155,6 +217,7 @@ class MainWindow(QMainWindow):
         # Output Excel file
         self.output_file_name = '2024-01'
         self.output_worksheet_name = 'Points Summary'
+        self.output_detail_worksheet_name = 'Detail Records'
 
         # create menus and display the empty table 
         self.create_menu()
@@ -210,8 +273,41 @@ class MainWindow(QMainWindow):
         import_other_action = QAction('Import Member Self-Reports (xlsx)', self)
         import_other_action.triggered.connect(self.import_other)
 
+        import_zip_action = QAction('Import Member Self-Reports from a Zip File', self)
+        import_zip_action.triggered.connect(self.import_other_zip)
+
+        import_period_action = QAction('Import a Period (folder with all three sources)', self)
+        import_period_action.triggered.connect(self.import_period)
+
+        open_session_action = QAction('Open a Saved Session', self)
+        open_session_action.triggered.connect(self.open_session)
+
+        save_session_action = QAction('Save the Session', self)
+        save_session_action.triggered.connect(self.save_session)
+
         export_action = QAction('Export the Results to Excel (xlsx)', self)
-        export_action.triggered.connect(self.export_data)
+        export_action.triggered.connect(lambda: self.export_data())
+
+        export_detail_action = QAction('Export the Results with Detail Records (xlsx)', self)
+        export_detail_action.triggered.connect(lambda: self.export_data(detail=True))
+
+        export_members_action = QAction('Export the Results with a Sheet per Member (xlsx)', self)
+        export_members_action.triggered.connect(self.export_member_sheets)
+
+        export_table_action = QAction('Export the Results to CSV, Parquet or JSON Lines', self)
+        export_table_action.triggered.connect(self.export_table_data)
+
+        export_anomalies_action = QAction('Export the Data Validation Report', self)
+        export_anomalies_action.triggered.connect(self.export_anomalies)
+
+        export_reconcile_action = QAction('Export the Reconciliation Report', self)
+        export_reconcile_action.triggered.connect(self.export_reconciliation)
+
+        export_statements_action = QAction('Export a Statement for Each Member (PDF or HTML)', self)
+        export_statements_action.triggered.connect(self.export_statements)
+
+        export_overlap_action = QAction('Export the Shift Overlap Report', self)
+        export_overlap_action.triggered.connect(self.export_overlaps)
 
         exit_action = QAction('Exit', self)
         exit_action.triggered.connect(self.close)
@@ -220,7 +316,18 @@ class MainWindow(QMainWindow):
         file_menu.addAction(import_iamresponding_action)
         file_menu.addAction(import_epcr_action)
         file_menu.addAction(import_other_action)
+        file_menu.addAction(import_zip_action)
+        file_menu.addAction(import_period_action)
+        file_menu.addAction(open_session_action)
+        file_menu.addAction(save_session_action)
         file_menu.addAction(export_action)
+        file_menu.addAction(export_detail_action)
+        file_menu.addAction(export_members_action)
+        file_menu.addAction(export_table_action)
+        file_menu.addAction(export_anomalies_action)
+        file_menu.addAction(export_reconcile_action)
+        file_menu.addAction(export_overlap_action)
+        file_menu.addAction(export_statements_action)
         file_menu.addAction(exit_action)
 
         # Edit menu
@@ -230,8 +337,52 @@ class MainWindow(QMainWindow):
         settings_action = QAction('Settings', self)
         settings_action.triggered.connect(self.open_settings)
 
+        anomalies_action = QAction('Data Validation Report', self)
+        anomalies_action.triggered.connect(self.open_anomalies)
+
+        reconcile_action = QAction('Reconciliation Report', self)
+        reconcile_action.triggered.connect(self.open_reconciliation)
+
+        retry_action = QAction('Retry the Files that Could Not Be Read', self)
+        retry_action.triggered.connect(self.retry_failed_files)
+
+        overlap_action = QAction('Shift Overlap Report', self)
+        overlap_action.triggered.connect(self.open_overlaps)
+
+        clear_cache_action = QAction('Clear the Cache of Imported Files', self)
+        clear_cache_action.triggered.connect(self.clear_cache)
+
+        date_range_action = QAction('Points for a Date Range', self)
+        date_range_action.triggered.connect(self.open_date_range)
+
+        add_history_action = QAction('Add this Period to the Service History', self)
+        add_history_action.triggered.connect(self.add_to_history)
+
+        history_action = QAction('Service History (Qualifying Years and Vesting)', self)
+        history_action.triggered.connect(self.open_history)
+
+        scenarios_action = QAction('What-if Scenarios for Other Scoring Rules', self)
+        scenarios_action.triggered.connect(self.open_scenarios)
+
+        scenarios_file_action = QAction('What-if Scenarios from a File', self)
+        scenarios_file_action.triggered.connect(self.open_scenarios_file)
+
+        compare_action = QAction('Compare with an Earlier Summary', self)
+        compare_action.triggered.connect(self.open_comparison)
+
         edit_menu.addAction(clear_action)        
         edit_menu.addAction(settings_action)
+        edit_menu.addAction(anomalies_action)
+        edit_menu.addAction(reconcile_action)
+        edit_menu.addAction(overlap_action)
+        edit_menu.addAction(retry_action)
+        edit_menu.addAction(clear_cache_action)
+        edit_menu.addAction(date_range_action)
+        edit_menu.addAction(add_history_action)
+        edit_menu.addAction(history_action)
+        edit_menu.addAction(compare_action)
+        edit_menu.addAction(scenarios_action)
+        edit_menu.addAction(scenarios_file_action)
         
         # Help menu
         about_action = QAction('About', self)
@@ -251,12 +402,175 @@ class MainWindow(QMainWindow):
         self.manual_window = ManualWindow()
         self.manual_window.show()
     
+    def open_member_records(self, index):
+        # the row in the (possibly filtered) table
+        name = self.model._data.iloc[index.row()]['Member Name']
+        self.records_window = RecordsWindow("Records for " + name, self.provenance.member(name))
+        self.records_window.show()
+
+    def open_anomalies(self):
+        title = "Data Validation Report (" + str(len(self.session.anomalies)) + " problems)"
+        self.anomalies_window = RecordsWindow(title, self.session.anomalies)
+        self.anomalies_window.show()
+
+    def open_reconciliation(self):
+        # self-reported signups and calls against IAR and ePCR (see reconcile.py)
+        report = discrepancies(reconcile(self.df, self.provenance.records()))
+        title = "Reconciliation Report (" + str(len(report)) + " differences)"
+        self.reconcile_window = RecordsWindow(title, report)
+        self.reconcile_window.show()
+
+    def open_date_range(self):
+        # the points of the records between two dates, without importing again (see timeline.py)
+        timeline = self.session.timeline()
+        if timeline.first_date() is None:
+            QMessageBox.information(self, "Points for a Date Range", "No records with a date were imported")
+            return
+        default = timeline.first_date().strftime('%Y-%m-%d') + ' to ' + timeline.last_date().strftime('%Y-%m-%d')
+        text, ok = QInputDialog.getText(self, "Points for a Date Range", "From and to (YYYY-MM-DD):",
+                                        QLineEdit.Normal, default)
+        if not ok:
+            return
+        try:
+            start, end = [part.strip() for part in text.split('to')]
+            summary = timeline.totals(pd.Timestamp(start), pd.Timestamp(end))
+        except ValueError as e:
+            print("Error in the date range:", e)
+            QMessageBox.information(self, "Points for a Date Range", "Enter two dates, e.g. " + default)
+            return
+        self.date_range_window = RecordsWindow("Points from " + start + " to " + end, summary)
+        self.date_range_window.show()
+
+    # ------------------------------------------------------------------- 
+    # Service history: the points of every period added, per member and year (see history.py)
+
+    def history_file(self, ask=False):
+        file_name = self.settings.value('service history file')
+        if ask or not file_name:
+            options = QFileDialog.Options() | QFileDialog.DontConfirmOverwrite
+            file_name, _ = QFileDialog.getSaveFileName(self, "Service History File",
+                                                       file_name or "Service History.csv",
+                                                       "CSV Files (*.csv)", options=options)
+            if file_name:
+                self.settings.setValue('service history file', file_name)
+        return file_name
+
+    def add_to_history(self):
+        file_name = self.history_file(ask=True)
+        if not file_name:
+            return
+        try:
+            history = ServiceHistory.load(file_name, scoring_rules=self.session.rules)
+            added = history.add_period(self.output_file_name, self.session.frames)
+            history.save(file_name)
+            self.statusBar().showMessage("Period " + self.output_file_name + " added to the service history ("
+                                         + str(len(added)) + " member years)", 0)
+        except Exception as e:
+            print("Error adding to the service history:", e)
+            QMessageBox.information(self, "Service History", str(e))
+
+    def open_history(self):
+        file_name = self.history_file()
+        if not file_name:
+            return
+        try:
+            history = ServiceHistory.load(file_name, scoring_rules=self.session.rules)
+        except Exception as e:
+            print("Error opening the service history:", e)
+            QMessageBox.information(self, "Service History", str(e))
+            return
+        status = history.status()
+        title = ("Service History (" + str(int(status['Vested'].sum())) + " vested, "
+                 + str(len(history.close_to_threshold())) + " close to "
+                 + str(history.rules['threshold']) + " points this year)")
+        self.history_window = RecordsWindow(title, status)
+        self.history_window.show()
+
+    def open_overlaps(self):
+        # calls and self-reported activities during the member's IAR shifts (see overlap.py)
+        report = overlap_report(self.session.frames)
+        in_shift, calls = calls_in_shift(report)
+        title = ("Shift Overlap Report (" + str(len(overlaps(report))) + " self-reported activities on a shift, "
+                 + str(in_shift) + " of " + str(calls) + " calls during a shift)")
+        # the flagged activities first
+        self.overlap_window = RecordsWindow(title, report)
+        self.overlap_window.show()
+
+    def open_comparison(self):
+        # the members added and removed and the points changed since a saved session or an
+        # exported summary (see compare.py)
+        options = QFileDialog.Options()
+        file_name, _ = QFileDialog.getOpenFileName(self, "Open an Earlier Summary", "",
+                                                   "Summaries (*.losap *.xlsx *.csv *.parquet *.jsonl)",
+                                                   options=options)
+        if not file_name:
+            return
+        try:
+            report = compare_summaries(load_summary(file_name, self.output_worksheet_name), self.df)
+        except Exception as e:
+            print("Error in reading the summary:", e)
+            QMessageBox.information(self, "Compare with an Earlier Summary",
+                                    "Could not read " + os.path.basename(file_name) + ": " + str(e))
+            return
+        counts = comparison_counts(report)
+        title = ("Changes since " + os.path.basename(file_name) + " (" + str(counts['Added']) + " members added, "
+                 + str(counts['Removed']) + " removed, " + str(counts['Changed']) + " with other points)")
+        self.comparison_window = RecordsWindow(title, report)
+        self.comparison_window.show()
+
+    def open_scenarios(self):
+        self.show_scenarios(example_scenarios)
+
+    def show_scenarios(self, scenarios):
+        # the total points and qualifying members under other scoring rules, from the
+        # records already imported (see scenarios.py)
+        summary, _ = ScenarioSimulator(self.session.frames, self.session.rules).compare(scenarios)
+        self.scenarios_window = RecordsWindow("What-if Scenarios (" + str(len(summary) - 1)
+                                              + " scenarios against the current rules)", summary)
+        self.scenarios_window.show()
+
+    def open_scenarios_file(self):
+        options = QFileDialog.Options()
+        file_name, _ = QFileDialog.getOpenFileName(self, "Open Scenarios", "", "JSON Files (*.json)",
+                                                   options=options)
+        if not file_name:
+            return
+        try:
+            scenarios = load_scenarios(file_name)
+        except Exception as e:
+            print("Error in reading the scenarios:", e)
+            QMessageBox.information(self, "What-if Scenarios", "Could not read " + os.path.basename(file_name)
+                                    + ": " + str(e))
+            return
+        self.show_scenarios(scenarios)
+
     def update_table(self):
-        self.model = PandasModel(self.df)
+        # a new summary: index it and show the rows matching the search box
+        self.member_index = MemberIndex(self.df)
+        self.filter_table()
+
+    def filter_table(self):
+        self.model = PandasModel(self.member_index.filter(self.search_box.text()))
         self.table_view.setModel(self.model)
 
+    def show_summary(self):
+        # the summary calculated by the session
+        self.df = self.session.summary
+        if __demo__:
+            self.df = self.df.head(15)
+        self.update_table()
+
+    def clear_cache(self):
+        # the files are read again at the next import
+        try:
+            self.session.cache.clear()
+            self.statusBar().showMessage("Cache cleared", 0)
+        except OSError as e:
+            print("Error clearing the cache:", e)
+
     def clear_all(self):
         self.df = self.original_df.copy()
+        self.session.clear()
         self.update_table()
 
     def open_settings(self):
@@ -317,10 +631,29 @@ class MainWindow(QMainWindow):
                 print(self.losap_rows_to_skip)
                 print(self.output_file_name)
                 print(self.output_worksheet_name)
+
+            # read the files again if the new settings change what is read from them
+            try:
+                changed = self.session.update_settings(self.reader_settings())
+                if changed:
+                    self.show_summary()
+                    self.statusBar().showMessage("Read again with the new settings: " + ", ".join(changed), 0)
+            except Exception as e:
+                print("Error reading the files with the new settings:", e)
         
         else:
             print("Dialog was closed")  
     
+    # the settings used to read the files (see default_settings in scoring.py)
+    def reader_settings(self):
+        return {'iamr_rows_to_skip': self.iamr_rows_to_skip, 
+                'iamr_rows_end': self.iamr_rows_end,
+                'losap_sheet': self.losap_sheet, 
+                'losap_name_pos': self.losap_name_pos,
+                'losap_SR_Signups': self.losap_SR_Signups, 
+                'losap_SR_Calls': self.losap_SR_Calls,
+                'losap_rows_to_skip': self.losap_rows_to_skip}
+
     # save settings
     def closeEvent(self, event):
         self.settings.setValue('window size', self.size())
@@ -344,69 +677,13 @@ class MainWindow(QMainWindow):
                                                    options=options)
         if file_name:
             try:
-                #data = pd.read_excel(file_name, header=self.iamr_rows_to_skip - 1, nrows=self.iamr_rows_end - self.iamr_rows_to_skip + 1)
-                #data.rename(columns={"Last name": "Member Name", "Shift hours": "Tour of Duty"}, inplace=True)
-
-                df_iamr = pd.read_excel(file_name, skiprows=self.iamr_rows_to_skip, 
-                        nrows=self.iamr_rows_end - self.iamr_rows_to_skip - 1)
-                
-                # create a new column with combined names: 'Last name, first name'
-                df_iamr['Member Name'] = df_iamr['Last name'] + ', ' + df_iamr['First name']
-                
-                # calculate the aggregate shift hours per person
-                df_group = df_iamr.groupby("Member Name")
-                df_columns = df_group[["Shift hours"]]
-                df_iamr_grouped = df_columns.sum().round(decimals=0).reset_index()
-                
-                if __debuggingiar__:
-                    print(df_iamr_grouped.head(5))
-                
-                # Calculate LOSAP points
-                #   Tour of Duty; 20 points maximum per year
-                #   One-half (1/2) point for each 6 hours of scheduled duty
-                df_iamr_grouped["Tour of Duty"] = (df_iamr_grouped["Shift hours"]/12).round(2)
-                
-                if __debuggingiar__:
-                    print(df_iamr_grouped.head(5))
-                
-                # If imposing the 20 points maximum, uncomment the next line
-                #df_iamr_grouped["Tour of Duty"] = (df_iamr_grouped["Shift hours"]/12).clip(upper=20)
-                
-                # Delete the hours column
-                df_iamr_grouped = df_iamr_grouped.drop(columns=['Shift hours'], axis=1)
-                
-                # Fix incorrect full names. e.g. 'Smith, Jon' should be 'Smith, John'
-                # *** TODO: Ask tem to fix Jon's name in IAR
-                df_iamr_grouped['Member Name'] = df_iamr_grouped['Member Name'].str.replace('Smith, Jon','Smith, John')
+                self.session.import_iamresponding(file_name, self.reader_settings())
                 
                 # lists the headings and the first 5 entries
                 if __debuggingiar__:
-                    print(df_iamr_grouped.head(5))
-                    print(self.df.head(5))
-
-                ############################################################
-                # Merge dataframes based on the member name
-                self.df = pd.merge(df_iamr_grouped, self.df, on="Member Name", how="left")
-                
-                try:
-                    self.df = pd.merge(df_iamr_grouped, self.df, on="Member Name", how="left")
-                except KeyError:
-                    self.df["Member Name"]=df_iamr_grouped['Member Name']
-                    self.df["Tour of Duty"]=df_iamr_grouped['Tour of Duty']
-                
-                # add up all the points
-                self.df['Total'] = self.df[self.colnamestoadd].sum(axis=1)
-                
-                # reorder the columns, sort and replace NAN
-                self.df = self.df[self.colnames]
-                self.df = self.df.sort_values(by=['Member Name'])
-                self.df = self.df.fillna(0)
-            
-                if __demo__:
-                    self.df = self.df.head(15)
+                    print(self.session.summary.head(5))
 
-                #self.df = data.reindex(columns=self.df.columns)
-                self.update_table() 
+                self.show_summary()
                 self.statusBar().showMessage("I am responsing data imported", 0)
             
             except Exception as e:
@@ -426,56 +703,12 @@ class MainWindow(QMainWindow):
         file_name, _ = QFileDialog.getOpenFileName(self, "Open CSV File", "", "CSV Files (*.csv)", options=options)
         if file_name:
             try:
-                df_ePCR = pd.read_csv(file_name)
-                
-                #rename column
-                df_ePCR.rename(columns={"Incident Crew Member Full Name": "Member Name"}, inplace=True)
-                
-                # Remove double spaces from the name field
-                df_ePCR['Member Name'] = \
-                    df_ePCR['Member Name'].str.replace(r'  ', ' ', regex=False)
-                
-                # Reverse first and last names 
-                new = df_ePCR['Member Name'].str.rsplit(" ", n = 1, expand = True) 
-                df_ePCR["First name"]= new[0] 
-                df_ePCR["Last name"]= new[1] 
-                
-                # Replace member name with combined names: 'Last name, first name'
-                df_ePCR['Member Name'] = df_ePCR['Last name'] + ', ' + df_ePCR['First name'] 
-                
-                # Count the number of calls per person
-                df_ePCR_grouped = df_ePCR.groupby("Member Name").size().reset_index(name='Calls Responded To')
-
-                # Now halve it to get the actual points
-                df_ePCR_grouped['Calls Responded To'] = df_ePCR_grouped['Calls Responded To']/2
-                
-                # delete the 'Calls Responded To' column
-                self.df = self.df.drop('Calls Responded To', axis=1)
-                
-                # Merge with existing DataFrame and add new 'Calls Responded To' column
-                try:
-                    #self.df = pd.merge(self.df, df_ePCR_grouped, on="Member Name", how="left")
-                    self.df = pd.merge(self.df, df_ePCR_grouped, how="outer", on=["Member Name", "Member Name"])
-                except KeyError:
-                    self.df["Member Name"]=df_ePCR_grouped['Member Name']
-                    self.df["Calls Responded To"]=df_ePCR_grouped['Calls Responded To']
+                self.session.import_epcr(file_name)
 
                 if __debuggingepcr__:
-                    print(self.df.head(5))
-                    print(df_ePCR_grouped.head(5))
-                    
-                # reorder the columns, sort and replace NAN with zero
-                self.df = self.df[self.colnames]
-                self.df = self.df.sort_values(by=['Member Name'])
-                self.df = self.df.fillna(0)
-                
-                # add up the points
-                self.df['Total'] = self.df[self.colnamestoadd].sum(axis=1)
+                    print(self.session.summary.head(5))
 
-                if __demo__:
-                    self.df = self.df.head(15)                
-  
-                self.update_table()
+                self.show_summary()
                 self.statusBar().showMessage("ePCR data imported", 0)
                 
             except Exception as e:
@@ -489,207 +722,173 @@ class MainWindow(QMainWindow):
     # "Tour of Duty", "Calls responded to" and "Positions held" are obtained elsewhere
 
     def import_other(self):
-        
+        options = QFileDialog.Options()
+        directory = QFileDialog.getExistingDirectory(self, "Select Directory", options=options)
+        if directory:
+            self.import_self_reports(directory)
+
+    def import_other_zip(self):
+        # the spreadsheets sent as one zip file are read from it, without extracting them
+        options = QFileDialog.Options()
+        file_name, _ = QFileDialog.getOpenFileName(self, "Open Zip File", "", "Zip Files (*.zip)",
+                                                   options=options)
+        if file_name:
+            self.import_self_reports(file_name)
+
+    def import_self_reports(self, directory):
+        # directory: a folder or a zip file with the self-reports
+
         # Ignore code warnings 
         warnings.simplefilter(action='ignore', category=UserWarning)
         
+        try:
+            files = self_report_files(directory, default_manifest_dir)
+            
+            # set up a progress dialog
+            progress_dialog = QProgressDialog("Importing Excel files...", "Cancel", 0, len(files), self)
+            progress_dialog.setWindowTitle("Import Progress")
+            progress_dialog.setWindowModality(Qt.WindowModal)
+            
+            def progress(n):
+                progress_dialog.setValue(n)
+                return not progress_dialog.wasCanceled()
+            
+            # the activity rows are checked before the points are calculated
+            self.session.import_self_reports(files, self.reader_settings(), progress)
+                    
+            if __debuggingother__:
+                print(self.session.summary.head(5))
+                
+            progress_dialog.close()
+            self.show_summary()
+            msg = "Self-reported data imported"
+            if len(self.session.anomalies) > 0:
+                msg += " (" + str(len(self.session.anomalies)) + " problems found, see Edit -> Data Validation Report)"
+            self.statusBar().showMessage(msg, 0)
+            self.show_failed_files()
+        except Exception as e:
+            print("Error processing self-reporting spreadsheets:", e)
+
+    # ------------------------------------------------------------------- 
+    # Files that could not be read (e.g. a spreadsheet without the 'point tracker' sheet):
+    # the other files are imported; the failed files can be read again after fixing them
+
+    def show_failed_files(self):
+        failed = self.session.failed_files()
+        if failed:
+            text = "\n".join(os.path.basename(file_name) + ": " + reason for _, file_name, reason in failed)
+            QMessageBox.information(self, "Files Not Imported",
+                                    str(len(failed)) + " files could not be read:\n\n" + text
+                                    + "\n\nFix them and use Edit -> Retry the Files that Could Not Be Read.")
+
+    def retry_failed_files(self):
+        kinds = sorted(set(kind for kind, _, _ in self.session.failed_files()))
+        if not kinds:
+            self.statusBar().showMessage("No files to read again", 0)
+            return
+        try:
+            for kind in kinds:
+                self.session.retry_failed(kind, self.reader_settings())
+        except Exception as e:
+            print("Error reading the files again:", e)
+            QMessageBox.information(self, "Retry", str(e))
+        self.show_summary()
+        self.statusBar().showMessage("Files read again", 0)
+        self.show_failed_files()
+
+    # ------------------------------------------------------------------- 
+    # Import all sources of a period at once: a folder with the 'iamresponding', 'ePCR'
+    # and 'user reported spreadsheets' folders. The sources are read at the same time
+    # in the background (see Session.import_period) and the points are calculated once
+
+    def import_period(self):
         
         options = QFileDialog.Options()
-        directory = QFileDialog.getExistingDirectory(self, "Select Directory", options=options)
+        directory = QFileDialog.getExistingDirectory(self, "Select the Period Folder", options=options)
         if directory:
+            progress_dialog = QProgressDialog("Importing the period...", None, 0, 0, self)
+            progress_dialog.setWindowTitle("Import Progress")
+            progress_dialog.setWindowModality(Qt.WindowModal)
+            progress_dialog.show()
+
+            # files read per source; set by the reading threads, shown by the timer
+            files_read = {}
+            def progress(kind, n):
+                files_read[kind] = n
+
+            # the period is read into a new session, which replaces the current one when
+            # it is complete; until then the windows keep showing the current session
+            session = Session(self.session.rules, self.session.cache)
+            session.validation_rules = self.session.validation_rules
+            executor = ThreadPoolExecutor(max_workers=1)
+            future = executor.submit(session.import_period, directory, 
+                                     self.reader_settings(), progress)
+            executor.shutdown(wait=False)
+
+            def check():
+                text = "Importing the period..."
+                for kind, n in files_read.items():
+                    text += "\n" + kind + ": " + str(n) + " files"
+                progress_dialog.setLabelText(text)
+                if not future.done():
+                    return
+                self.period_timer.stop()
+                progress_dialog.close()
+                try:
+                    errors = future.result()
+                except Exception as e:
+                    print("Error importing the period:", e)
+                    return
+                self.session = session
+                self.provenance = self.session.provenance
+                self.show_summary()
+                msg = "Period imported"
+                if errors:
+                    msg += " (" + "; ".join(kind + ": " + problem for kind, problem in errors.items()) + ")"
+                if len(self.session.anomalies) > 0:
+                    msg += " (" + str(len(self.session.anomalies)) + " problems found, see Edit -> Data Validation Report)"
+                self.statusBar().showMessage(msg, 0)
+                self.show_failed_files()
+
+            # the window stays responsive while the files are read
+            self.period_timer = QTimer(self)
+            self.period_timer.timeout.connect(check)
+            self.period_timer.start(100)
+
+    # ------------------------------------------------------------------- 
+    # Save the rows read from the files, so the points can be calculated again later
+    # without the original files (see session.py)
+
+    def save_session(self):
+        options = QFileDialog.Options()
+        file_name, _ = QFileDialog.getSaveFileName(self, "Save Session", "", 
+                                                   "LOSAP Sessions (*.losap)", 
+                                                   options=options)
+        if file_name:
             try:
-                files = os.listdir(directory)
-                total_files = len(files)
-                df_losap   = pd.DataFrame() 
-                df_losapSR = pd.DataFrame() 
-                i=0
-                
-                # set up a progress dialog
-                progress_dialog = QProgressDialog("Importing Excel files...", "Cancel", 0, total_files, self)
-                progress_dialog.setWindowTitle("Import Progress")
-                progress_dialog.setWindowModality(Qt.WindowModal)
-                progress = 0
-                
-                for file in files:
-                    if file.endswith('.xlsx') and not(file.startswith('~')):
-                        file_path = os.path.join(directory, file)
-                        #df = pd.read_excel(file_path)
-                        #dfs.append(df)
-                        if __debuggingother__:
-                            print(file_path)
-                            
-                        workbook = pd.read_excel(open(file_path, 'rb'), 
-                                                 sheet_name=self.losap_sheet, 
-                                                 skiprows=self.losap_rows_to_skip) 
-                        
-                        # open the workbook again to get the name of the person 
-                        wb = load_workbook(filename = file_path)
-                        sheet_range = wb[self.losap_sheet]
-                        workbook['Member Name'] = sheet_range[self.losap_name_pos].value
-
-                        #   Read the portion of the spreadsheet that contains self-reported hours
-                        df_losapSR.loc[i, ['Member Name']] = str(sheet_range[self.losap_name_pos].value)
-                        df_losapSR.loc[i,['SR_Signup']] = sheet_range[self.losap_SR_Signups].value
-                        df_losapSR.loc[i,['SR_Calls']]  = sheet_range[self.losap_SR_Calls].value
-                        i=i+1
-                        
-                        # update the progress dialog
-                        progress += 1
-                        progress_dialog.setValue(progress)
-                        if progress_dialog.wasCanceled():
-                            break
-                       
-                        df_losap=pd.concat([df_losap, workbook], sort=False)
-                        
-                        
-                if df_losap.shape[0] > 0:
-                    print('starting  to process df_losap')
-                    df_losap = df_losap.reset_index()
-                    df_losapSR = df_losapSR.reset_index()
-                    
-                    # replace NAN with zero
-                    df_losapSR=df_losapSR.fillna(0)
-                    print(df_losapSR)
-                    
-                    # rename some of the headings
-                    df_losap.columns = df_losap.columns.str.replace('Activity \n(not hours & calls)', 'Activity') 
-                    df_losap.columns = df_losap.columns.str.replace('time spent \n(in hours)', 'Hours') 
-                    df_losap.columns = df_losap.columns.str.replace('Description ', 'Description') 
-
-                    # Swap the first and last names if needed
-                    df_losap = swap_name_order(df_losap)
-                    df_losapSR = swap_name_order(df_losapSR)
-                    
-                    # Some members fail to complete the Hours field and Python reads this as NaN
-                    # Replace NaN with 1, with the assumption that the event lasted 1 hour
-                    df_losap['Hours'] = df_losap['Hours'].fillna(1)
-                    
-                    # drop some columns
-                    df_losap = df_losap.drop(columns=['Date', 'Description', 'Notes/Questions', 
-                            'Activity code','index'], axis=1)
-                    
-                    # Delete rows with an undefined Activity
-                    df_losap.dropna(subset=['Activity'], inplace=True)
-                    
-                    # Split up the data by activity
-                    #   Categories to parse are "Training", "Drills", "Meetings", "Misc Activity"
-                    df_losap_meetings = df_losap[df_losap['Activity']=='Meetings'].reset_index()
-                    df_losap_drills   = df_losap[df_losap['Activity']=='Drills, CMEs'].reset_index()
-                    df_losap_training = df_losap[df_losap['Activity']=='Training Course'].reset_index()
-                    df_losap_misc     = df_losap[df_losap['Activity']=='Miscellaneous'].reset_index()
-                    df_losap_disability = df_losap[df_losap['Activity']=='Disability'].reset_index()
-                    
-                    #-----------------------------------------------------------
-                    # Calculate points
-                    # ------------------
-                    #   Meetings:   1 point per attendance, irrespective of the meeting duration
-                    df_losap_meetings = df_losap_meetings.groupby(['Member Name'])['Hours'].agg('count').reset_index()
-                    df_losap_meetings = df_losap_meetings.rename(columns={"Hours": "Meetings"})
-                    
-                    # ------------------
-                    #   Training:   1 point/h with a max of 5 points if less than 20 hours
-                    #               1 point/h with a max of 10 points between 20-45 hours
-                    #               15 points if more than 45 hours
-                    #   Here we will simply calculate the points and not consider annual limits 
-                    df_losap_training = df_losap_training.groupby(['Member Name'])['Hours'].agg('sum').reset_index()
-                    df_losap_training = df_losap_training.rename(columns={"Hours": "Training"})
-                    
-                    # ------------------
-                    #   Drills:     One (1) point per drill or seminar (minimum two hours duration).
-                    #               2 point if more than 4 hours 
-                    # df_losap_drills['Drills']=0
-                    # for i in df_losap_drills.index:
-                    #     h = float(df_losap_drills['Hours'][i])
-                    #     if (h >= 2 and h <= 4):
-                    #         df_losap_drills.loc[i, "Drills"] = 1
-                    #     elif (h > 4):
-                    #         df_losap_drills.loc[i, "Drills"] = 2
-                    df_losap_drills = df_losap_drills.groupby(['Member Name'])['Points'].agg('sum').reset_index()
-                    df_losap_drills = df_losap_drills.rename(columns={"Points": "Drills"})
-                    
-                    # ------------------
-                    #   Misc:     One point per activity for participation in activities 
-                    df_losap_misc = df_losap_misc.groupby(['Member Name'])['Points'].agg('sum').reset_index()
-                    df_losap_misc = df_losap_misc.rename(columns={"Points": "Misc Activity"})
-                    
-                    # ------------------
-                    #   Disability: Read the points from the points column & cap at 5
-                    df_losap_disability = df_losap_disability.groupby(['Member Name'])['Points'].agg('sum').reset_index()
-                    df_losap_disability = df_losap_disability.rename(columns={"Points": "Disability"})
-                    df_losap_disability['Disability'] = df_losap_disability['Disability'].clip(upper=5.0)
-                
-                    # ------------------
-                    #  Self-reported points for Tour of Duty (signups)
-                    #       One-half (1/2) point for each 6 hours of scheduled duty
-                    df_losapSR["SR_Signup"] = (df_losapSR["SR_Signup"]/12).round(3)
-                    df_losapSR['SR_Signup'] = df_losapSR['SR_Signup'].fillna(0)
-
-                    # ------------------
-                    #  Self-reported points for Calls Responded To ['SR Calls Responded To']
-                    #  0.5 points to each call responded to, with a maximum of 25 points per year
-                    df_losapSR["SR_Calls"] = (df_losapSR["SR_Calls"]/2)
-                    df_losapSR['SR_Calls'] = df_losapSR['SR_Calls'].fillna(0)
-
-                    # New section to join the two self-reported columns
-                    df_losapSR["SR_Total"] = df_losapSR["SR_Calls"] + df_losapSR['SR_Signup']
-
-                    # Merge meetings with existing DataFrame 
-                    self.df = pd.merge(self.df, df_losap_meetings, how="outer", on=["Member Name", "Member Name"])
-                    self.df = self.df.drop('Meetings_x', axis=1)
-                    self.df = self.df.rename(columns={'Meetings_y': 'Meetings'})
-                    
-                    # Merge drills with existing DataFrame 
-                    self.df = pd.merge(self.df, df_losap_drills, how="outer", on=["Member Name", "Member Name"])
-                    self.df = self.df.drop('Drills_x', axis=1)
-                    self.df = self.df.rename(columns={'Drills_y': 'Drills'})
-                    
-                    # Merge training with existing DataFrame 
-                    self.df = pd.merge(self.df, df_losap_training, how="outer", on=["Member Name", "Member Name"])
-                    self.df = self.df.drop('Training_x', axis=1)
-                    self.df = self.df.rename(columns={'Training_y': 'Training'})         
-                    
-                    # Merge misc with existing DataFrame 
-                    self.df = pd.merge(self.df, df_losap_misc, how="outer", on=["Member Name", "Member Name"])
-                    self.df = self.df.drop('Misc. Activity', axis=1)
-                    self.df = self.df.rename(columns={'Misc Activity': 'Misc. Activity'})      
- 
-                    # Merge disability with existing DataFrame 
-                    #self.df = df_losap_disability.rename(columns={'Disability': 'Disability'})
-                    self.df = pd.merge(self.df, df_losap_disability, how="outer", on=["Member Name", "Member Name"])
-                    self.df = self.df.drop('Disability_x', axis=1)
-                    self.df = self.df.rename(columns={'Disability_y': 'Disability'})  
-
-                    # now that we've calcualted the total, drop the Signup and Calls columns
-                    df_losapSR = df_losapSR.drop('SR_Signup', axis=1)
-                    df_losapSR = df_losapSR.drop('SR_Calls', axis=1)
-
-                    # Merge self-reported points with df_losapSRDataframe
-                    self.df = pd.merge(self.df, df_losapSR, how="outer", on=["Member Name", "Member Name"]) 
-                    #self.df = self.df.drop(['SR_Signup_x','SR_Calls_x'], axis=1)
-                    #self.df = self.df.rename(columns={'SR_Signup_y': 'SR_Signup'})
-                    #self.df = self.df.rename(columns={'SR_Calls_y': 'SR_Calls'})
-                    self.df = self.df.drop('SR_Total_x', axis=1)
-                    self.df = self.df.rename(columns={'SR_Total_y': 'SR_Total'})
+                if not file_name.endswith('.losap'):
+                    file_name += '.losap'
+                self.session.save(file_name)
+                self.statusBar().showMessage("Session saved", 0)
+            except Exception as e:
+                print("Error saving the session:", e)
 
-                    
-                    
-                    # reorder the columns, sort and replace NAN with zero
-                    self.df = self.df[self.colnames]
-                    self.df = self.df.sort_values(by=['Member Name'])
-                    self.df = self.df.fillna(0)
-                    
-                    # add up the points
-                    self.df['Total'] = self.df[self.colnamestoadd].sum(axis=1)
-      
-                    if __demo__:
-                        self.df = self.df.head(15)   
-                    
-                    progress_dialog.close()
-                    self.update_table()
+    def open_session(self):
+        options = QFileDialog.Options()
+        file_name, _ = QFileDialog.getOpenFileName(self, "Open Session", "", 
+                                                   "LOSAP Sessions (*.losap)", 
+                                                   options=options)
+        if file_name:
+            try:
+                self.session = Session.load(file_name, self.session.cache)
+                self.provenance = self.session.provenance
+                self.show_summary()
+                self.statusBar().showMessage("Session opened", 0)
             except Exception as e:
-                print("Error processing self-reporting spreadsheets:", e)
+                print("Error opening the session:", e)
+                QMessageBox.information(self, "Open Session", str(e))
 
-    def export_data(self):
+    def export_data(self, detail=False):
         #bk_blue = 4472c4
         #bk_drkblue = 305496
         #cell_gray = d9d9d9
@@ -728,6 +927,19 @@ class MainWindow(QMainWindow):
                              #worksheet.write(row_num, col_num+1, value, format_to_apply)
                              worksheet.write(row_num, col_num, value, format_to_apply)
                     
+                    # Optionally add a sheet with every record that contributed points
+                    if detail:
+                        records = self.provenance.records()
+                        records.to_excel(writer, sheet_name=self.output_detail_worksheet_name, 
+                                         index=False)
+                        detail_sheet = writer.sheets[self.output_detail_worksheet_name]
+                        date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+                        for col_num, value in enumerate(records.columns.values):
+                            detail_sheet.write(0, col_num, value, header_format)
+                        detail_sheet.set_column(0, 0, 25)
+                        detail_sheet.set_column(3, 3, 12, date_format)
+                        detail_sheet.set_column(4, 4, 40)
+                    
                     # Save and close the workbook
                     #writer.save()
                     writer.close()
@@ -735,7 +947,123 @@ class MainWindow(QMainWindow):
             except Exception as e:
                 print("Error in processing the export file:", e)
 
+    # ------------------------------------------------------------------- 
+    # Export the summary and one sheet per member with the records behind their points
+    # (written row by row, so large rosters do not need to be held in memory)
+    
+    def export_member_sheets(self):
+        options = QFileDialog.Options()
+        default_file_name = self.output_file_name + ' Points Detail.xlsx'        
+        file_name, _ = QFileDialog.getSaveFileName(self, "Save Excel File", default_file_name, 
+                                                   "Excel Files (*.xlsx)", options=options)
+        if file_name:
+            try:
+                write_member_workbook(file_name, self.df, self.provenance, 
+                                      self.output_worksheet_name)
+                self.statusBar().showMessage("Exported " + file_name, 0)
+            except Exception as e:
+                print("Error in processing the export file:", e)
+
+    # ------------------------------------------------------------------- 
+    # Export to data files for other systems (CSV, Parquet or JSON Lines)
+    
+    def export_table_data(self):
+        options = QFileDialog.Options()
+        default_file_name = self.output_file_name + ' Points.csv'
+        filters = {"CSV Files (*.csv)": '.csv', "Parquet Files (*.parquet)": '.parquet', 
+                   "JSON Lines Files (*.jsonl)": '.jsonl'}
+        file_name, selected = QFileDialog.getSaveFileName(self, "Save Data File", default_file_name, 
+                                                          ";;".join(filters), options=options)
+        if file_name:
+            if table_format(file_name) is None:
+                file_name = file_name + filters.get(selected, '.csv')
+            rsp = QMessageBox.question(self, "Export", "Also export the detail records?", 
+                                       QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            records = self.provenance.records() if rsp == QMessageBox.Yes else None
+            try:
+                export_table(file_name, self.df, records)
+                self.statusBar().showMessage("Exported " + file_name, 0)
+            except ImportError as e:
+                QMessageBox.information(self, "Missing package", str(e))
+            except Exception as e:
+                print("Error in processing the export file:", e)
+
+    # ------------------------------------------------------------------- 
+    # Export the problems found in the self-reported activities (xlsx or csv)
+    
+    def export_anomalies(self):
+        options = QFileDialog.Options()
+        default_file_name = self.output_file_name + ' Data Validation.xlsx'
+        file_name, _ = QFileDialog.getSaveFileName(self, "Save Report", default_file_name, 
+                                                   "Excel Files (*.xlsx);;CSV Files (*.csv)", 
+                                                   options=options)
+        if file_name:
+            try:
+                write_anomaly_report(file_name, self.session.anomalies)
+                self.statusBar().showMessage("Exported " + file_name, 0)
+            except Exception as e:
+                print("Error in processing the export file:", e)
+
+    # ------------------------------------------------------------------- 
+    # Export the differences between the self-reported and the IAR / ePCR points
+    
+    def export_reconciliation(self):
+        options = QFileDialog.Options()
+        default_file_name = self.output_file_name + ' Reconciliation.xlsx'
+        file_name, _ = QFileDialog.getSaveFileName(self, "Save Report", default_file_name, 
+                                                   "Excel Files (*.xlsx);;CSV Files (*.csv)", 
+                                                   options=options)
+        if file_name:
+            try:
+                report = reconcile(self.df, self.provenance.records())
+                write_reconciliation_report(file_name, report)
+                self.statusBar().showMessage("Exported " + file_name, 0)
+            except Exception as e:
+                print("Error in processing the export file:", e)
+
+    # ------------------------------------------------------------------- 
+    # Export the calls and self-reported activities during the IAR shifts
+    
+    def export_overlaps(self):
+        options = QFileDialog.Options()
+        default_file_name = self.output_file_name + ' Shift Overlaps.xlsx'
+        file_name, _ = QFileDialog.getSaveFileName(self, "Save Report", default_file_name, 
+                                                   "Excel Files (*.xlsx);;CSV Files (*.csv)", 
+                                                   options=options)
+        if file_name:
+            try:
+                write_overlap_report(file_name, overlap_report(self.session.frames))
+                self.statusBar().showMessage("Exported " + file_name, 0)
+            except Exception as e:
+                print("Error in processing the export file:", e)
+
+    # ------------------------------------------------------------------- 
+    # One statement per member, written by several processes (see statements.py)
+
+    def export_statements(self):
+        options = QFileDialog.Options()
+        folder = QFileDialog.getExistingDirectory(self, "Folder for the Statements", options=options)
+        if not folder:
+            return
+        fmt, ok = QInputDialog.getItem(self, "Member Statements", "Format:", ['PDF', 'HTML'], 0, False)
+        if not ok:
+            return
+        progress_dialog = QProgressDialog("Writing statements...", None, 0, len(self.df), self)
+        progress_dialog.setWindowTitle("Member Statements")
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        try:
+            files = write_statements(folder, self.df, self.provenance, fmt.lower(),
+                                     period=self.output_file_name, progress=progress_dialog.setValue)
+            self.statusBar().showMessage(str(len(files)) + " statements written to " + folder, 0)
+        except Exception as e:
+            print("Error writing the statements:", e)
+            QMessageBox.information(self, "Member Statements", str(e))
+        finally:
+            progress_dialog.close()
+
 if __name__ == '__main__':
+    # the statements are written by other processes (also in the packaged program)
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -0,0 +1,132 @@
+# Overlap of calls and self-reported activities with the IAR duty shifts
+#
+# For the audit: was a call credited in ePCR made during one of the member's scheduled
+# shifts, and does a self-reported activity (drill, training, meeting) fall on a duty
+# shift, so the same hours would count twice?
+#
+# The shifts of all members are sorted by member and start, with the latest end of the
+# shifts so far (as the maximum end kept in the nodes of an interval tree). For each
+# call or activity, a binary search finds the last shift of the member starting before
+# the activity ends; the activity overlaps a shift when the latest end up to that shift
+# is after the activity starts. All calls and activities are looked up at once, in
+# O((n + m) log n) for n shifts and m calls and activities.
+#
+# The ePCR and self-report dates have no time, so a call or activity is the whole day.
+
+import numpy as np
+import pandas as pd
+
+from export import export_table, table_format, write_summary_workbook
+
+shift_category = 'Tour of Duty'
+
+# records that are not checked against the shifts (no date; see importers.py)
+unchecked_categories = ['SR_Signup', 'SR_Calls']
+
+# calls are only reported; self-reported activities on a duty shift are flagged
+call_categories = ['Calls Responded To']
+
+report_columns = ['Member Name', 'Category', 'Date', 'Source', 'Row', 'Incident',
+                  'In Shift', 'Shift Start', 'Shift End', 'Shift Row', 'Overlap Hours', 'Flagged']
+
+
+def find_shifts(shift_key, shift_end_key, event_start_key, event_end_key):
+    # For each event (start, end): does it overlap a shift, and the position of the
+    # overlapping shift ending last. The keys are times in the span of each member
+    order = np.argsort(shift_key, kind='stable')
+    start_key, end_key = shift_key[order], shift_end_key[order]
+    if len(order) == 0:
+        return np.zeros(len(event_start_key), dtype=bool), np.zeros(len(event_start_key), dtype=int)
+    # the latest end so far, and the shift it belongs to
+    latest_end = np.maximum.accumulate(end_key)
+    latest_shift = np.maximum.accumulate(np.where(end_key == latest_end, np.arange(len(order)), 0))
+
+    last = np.searchsorted(start_key, event_end_key, 'left') - 1
+    candidate = last.clip(min=0)
+    # a shift of another member always ends before this member's span starts
+    in_shift = (last >= 0) & (latest_end[candidate] > event_start_key)
+    return in_shift, order[latest_shift[candidate]]
+
+
+def overlap_report(frames):
+    # frames: source kind -> records as produced by the importers (the IAR records with
+    # the Start and End of each shift)
+    frames = [df for df in frames.values() if len(df) > 0]
+    shifts = [df for df in frames if 'Start' in df.columns]
+    events = [df for df in frames if 'Start' not in df.columns]
+    if not events:
+        return pd.DataFrame(columns=report_columns)
+    events = pd.concat(events, ignore_index=True)
+    events = events[events['Member Name'].notna() & events['Date'].notna()
+                    & ~events['Category'].astype(str).isin(unchecked_categories)].reset_index(drop=True)
+    if 'Incident' not in events.columns:
+        events['Incident'] = None
+    shift_columns = ['Member Name', 'Category', 'Start', 'End', 'Row']
+    shifts = pd.concat([df[shift_columns] for df in shifts] or [pd.DataFrame(columns=shift_columns)],
+                       ignore_index=True)
+    shifts = shifts[(shifts['Category'] == shift_category) & shifts['Member Name'].notna()
+                    & shifts['Start'].notna() & shifts['End'].notna()].reset_index(drop=True)
+    shift_start = pd.to_datetime(shifts['Start'])
+    shift_end = pd.to_datetime(shifts['End'])
+    day_start = pd.to_datetime(events['Date']).dt.normalize()
+    day_end = day_start + pd.Timedelta(days=1)
+
+    # times in seconds from the earliest time; every member gets a span of its own
+    origin = min(day_start.min(), shift_start.min()) if len(shifts) else day_start.min()
+    latest = max(day_end.max(), shift_end.max()) if len(shifts) else day_end.max()
+    span = (latest - origin) // pd.Timedelta(seconds=1) + 1
+    members = pd.Index(pd.concat([shifts['Member Name'].astype(str),
+                                  events['Member Name'].astype(str)]).unique())
+
+    def keys(names, times):
+        code = members.get_indexer(names.astype(str)).astype(np.int64)
+        return code * span + ((times - origin) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64)
+
+    in_shift, shift = find_shifts(keys(shifts['Member Name'], shift_start),
+                                  keys(shifts['Member Name'], shift_end),
+                                  keys(events['Member Name'], day_start),
+                                  keys(events['Member Name'], day_end))
+
+    report = pd.DataFrame({
+        'Member Name': events['Member Name'].astype(str).to_numpy(),
+        'Category': events['Category'].astype(str).to_numpy(),
+        'Date': day_start.to_numpy(),
+        'Source': events['Source'].astype(str).to_numpy(),
+        'Row': events['Row'].to_numpy(),
+        'Incident': events['Incident'].to_numpy(),
+        'In Shift': in_shift})
+    if len(shifts):
+        report['Shift Start'] = shift_start.to_numpy()[shift]
+        report['Shift End'] = shift_end.to_numpy()[shift]
+        report['Shift Row'] = shifts['Row'].to_numpy(dtype=float)[shift]
+        report.loc[~in_shift, ['Shift Start', 'Shift End', 'Shift Row']] = np.nan
+    else:
+        report['Shift Start'] = pd.NaT
+        report['Shift End'] = pd.NaT
+        report['Shift Row'] = np.nan
+    overlap = (np.minimum(report['Shift End'], day_end) - np.maximum(report['Shift Start'], day_start))
+    report['Overlap Hours'] = (overlap / pd.Timedelta(hours=1)).fillna(0).round(2)
+    report['Flagged'] = in_shift & ~report['Category'].isin(call_categories)
+
+    report = report.sort_values(['Flagged', 'Member Name', 'Date'],
+                                ascending=[False, True, True], kind='stable')
+    return report[report_columns].reset_index(drop=True)
+
+
+def overlaps(report):
+    # the self-reported activities on a duty shift
+    return report[report['Flagged']].reset_index(drop=True)
+
+
+def calls_in_shift(report):
+    calls = report[report['Category'].isin(call_categories)]
+    return int(calls['In Shift'].sum()), len(calls)
+
+
+def write_overlap_report(file_name, report):
+    # xlsx: the flagged activities, then all calls and activities
+    if table_format(file_name) is None:
+        write_summary_workbook(file_name, overlaps(report), 'Activities on Shifts',
+                               report, 'All Calls and Activities')
+    else:
+        export_table(file_name, report)
@@ -0,0 +1,110 @@
+# Point-level provenance
+#
+# Every record that contributes points (an IAR shift, an ePCR incident, a line on a
+# member's self-report spreadsheet) is kept with the file and row it came from, so a
+# member's total can be traced back to its sources. The records of all sources are
+# kept in one frame sorted by member, with a lookup of the rows belonging to each
+# member, so the records of one member are found without scanning the whole frame.
+
+import numpy as np
+import pandas as pd
+
+record_columns = ['Member Name', 'Category', 'Points', 'Date', 'Source', 'Row']
+
+# The records as the importers produce them (see importers.py): the quantity (hours,
+# calls, attendances or points) is turned into points by scoring.aggregate()
+input_columns = ['Member Name', 'Category', 'Quantity', 'Date', 'Source', 'Row']
+
+
+def excel_dates(values):
+    # Dates are Excel serial numbers in some exports and dates/strings in others
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # convert each distinct date once
+        dates = excel_dates(pd.Series(values.cat.categories))
+        codes = values.cat.codes.to_numpy()
+        return pd.Series(np.where(codes >= 0, dates.to_numpy()[codes.clip(min=0)],
+                                  np.datetime64('NaT')), index=values.index)
+    numbers = pd.to_numeric(values, errors='coerce')
+    if numbers.notna().any():
+        return pd.to_datetime(numbers, unit='D', origin='1899-12-30')
+    return pd.to_datetime(values, errors='coerce')
+
+
+def dated_between(df, start=None, end=None):
+    # the rows of df dated from start to end (whole days, both included), as the points
+    # of a date range (see timeline.py); rows without a date are left out
+    days = pd.to_datetime(df['Date'], errors='coerce').dt.normalize()
+    keep = days.notna()
+    if start is not None:
+        keep &= days >= pd.Timestamp(start).normalize()
+    if end is not None:
+        keep &= days <= pd.Timestamp(end).normalize()
+    return df[keep.to_numpy()].reset_index(drop=True)
+
+
+def make_input(member, category, quantity, date, source, row, **extra):
+    # extra: other columns kept with the records (e.g. the start and end of a shift)
+    df = pd.DataFrame({'Member Name': member, 'Category': category,
+                       'Quantity': quantity, 'Date': date, 'Source': source,
+                       'Row': row}, columns=input_columns)
+    for col, values in extra.items():
+        df[col] = values
+    return df
+
+
+class ProvenanceIndex:
+    def __init__(self):
+        self.sources = {}       # source kind ('IAR', 'ePCR', 'Self-reports') -> records
+        self._records = None
+        self._members = None
+
+    def set_records(self, kind, records):
+        # importing a source again replaces its records
+        self.sources[kind] = records
+        self._records = None
+
+    def clear(self):
+        self.sources = {}
+        self._records = None
+
+    def records(self):
+        if self._records is None:
+            self._build()
+        return self._records
+
+    def _build(self):
+        frames = [df for df in self.sources.values() if len(df) > 0]
+        if frames:
+            df = pd.concat(frames, ignore_index=True)
+        else:
+            df = pd.DataFrame(columns=record_columns)
+        df['Member Name'] = df['Member Name'].astype(str).astype('category')
+        df['Category'] = df['Category'].astype('category')
+        df['Source'] = df['Source'].astype(str).astype('category')
+        df['Points'] = pd.to_numeric(df['Points'], errors='coerce').astype('float32')
+        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+        df['Row'] = pd.to_numeric(df['Row'], errors='coerce').fillna(0).astype('int32')
+        df = df.sort_values(['Member Name', 'Date'], kind='stable').reset_index(drop=True)
+
+        # member name -> slice of rows
+        codes = df['Member Name'].cat.codes.to_numpy()
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else []
+        ends = list(starts[1:]) + [len(codes)]
+        names = df['Member Name'].cat.categories
+        self._members = {names[codes[s]]: slice(s, e) for s, e in zip(starts, ends)}
+        self._records = df
+
+    def between(self, start=None, end=None):
+        # a new index with the records of a date range (see dated_between)
+        index = ProvenanceIndex()
+        for kind, df in self.sources.items():
+            index.set_records(kind, dated_between(df, start, end))
+        return index
+
+    def member_rows(self, name):
+        # slice of records() holding the records of this member
+        self.records()
+        return self._members.get(name, slice(0, 0))
+
+    def member(self, name):
+        return self.records().iloc[self.member_rows(name)]
@@ -0,0 +1,80 @@
+# Reconciliation of the self-reported points with the systems of record
+#
+# Members report their signup hours (E7) and calls (E8) on their spreadsheet. These are
+# compared with the 'Tour of Duty' points from I am Responding and the 'Calls Responded
+# To' points from ePCR. The self-reported values are taken from the provenance records
+# (one pivot for all members), joined once with the summary, and the differences of all
+# members and categories are calculated at once. Differences larger than both the
+# absolute and the relative tolerance are flagged, largest first.
+
+import numpy as np
+import pandas as pd
+
+from export import export_table, table_format, write_summary_workbook
+
+# differences are flagged when they exceed both tolerances (in points, and as a
+# fraction of the larger of the two values)
+default_tolerances = {'absolute': 1.0, 'relative': 0.10}
+
+# (system of record column in the summary, self-reported record category)
+comparisons = [('Tour of Duty', 'SR_Signup'),
+               ('Calls Responded To', 'SR_Calls')]
+
+report_columns = ['Member Name', 'Category', 'System', 'Self-reported', 'Difference',
+                  'Abs. Difference', 'Rel. Difference', 'Flagged']
+
+
+def reconcile(summary, records, tolerances=None, include_missing=False):
+    # include_missing: also compare members who did not send in a self-report
+    tol = dict(default_tolerances)
+    tol.update(tolerances or {})
+
+    sr_categories = [sr for _, sr in comparisons]
+    sr = records[records['Category'].isin(sr_categories)]
+    sr = sr.pivot_table(index='Member Name', columns='Category', values='Points',
+                        aggfunc='sum', observed=True)
+    sr = sr.reindex(columns=sr_categories).reset_index()
+    sr['Member Name'] = sr['Member Name'].astype(str)
+
+    system_cols = [system for system, _ in comparisons]
+    how = 'outer' if include_missing else 'right'
+    df = pd.merge(summary[['Member Name'] + system_cols], sr, on='Member Name', how=how)
+
+    frames = []
+    for system, reported in comparisons:
+        frames.append(pd.DataFrame({'Member Name': df['Member Name'].to_numpy(),
+                                    'Category': system,
+                                    'System': df[system].to_numpy(),
+                                    'Self-reported': df[reported].to_numpy()}))
+    report = pd.concat(frames, ignore_index=True)
+    # the record points are float32 (see compact.py)
+    system_values = pd.to_numeric(report['System'], errors='coerce').fillna(0).to_numpy(dtype=float).round(3)
+    reported_values = pd.to_numeric(report['Self-reported'], errors='coerce').fillna(0).to_numpy(dtype=float).round(3)
+    report['System'] = system_values
+    report['Self-reported'] = reported_values
+
+    diff = reported_values - system_values
+    abs_diff = np.abs(diff)
+    larger = np.maximum(np.abs(system_values), np.abs(reported_values))
+    rel_diff = np.divide(abs_diff, larger, out=np.zeros_like(abs_diff), where=larger > 0)
+    report['Difference'] = diff.round(3)
+    report['Abs. Difference'] = abs_diff.round(3)
+    report['Rel. Difference'] = rel_diff.round(3)
+    report['Flagged'] = (abs_diff > tol['absolute']) & (rel_diff > tol['relative'])
+
+    report = report.sort_values(['Flagged', 'Abs. Difference', 'Member Name'],
+                                ascending=[False, False, True], kind='stable')
+    return report[report_columns].reset_index(drop=True)
+
+
+def discrepancies(report):
+    return report[report['Flagged']].reset_index(drop=True)
+
+
+def write_reconciliation_report(file_name, report):
+    # xlsx: the flagged differences (largest first), then all comparisons
+    if table_format(file_name) is None:
+        write_summary_workbook(file_name, discrepancies(report), 'Discrepancies',
+                               report, 'All Members')
+    else:
+        export_table(file_name, report)
@@ -0,0 +1,273 @@
+# Regression check of the whole calculation against stored results
+#
+# Runs the import and the calculation without the main window over
+#   fixtures   the sample files in iamresponding/, ePCR/ and 'user reported spreadsheets/'
+#   large      a generated ePCR export and a folder of generated self-reports (made
+#              from the sample spreadsheets), plus generated IAR shifts
+# and compares the summary, the records and the overlap report (of the large set: the
+# summary and the overlaps per member) with the files in golden/. The fixtures are also
+# imported in every other order of the sources, which must give the same summary (the
+# IAR points were once merged so that members without IAR shifts were dropped when the
+# IAR report was imported last). Every stage (reading each source, calculating the
+# points, the overlap report) is timed and its peak memory measured; a stage that takes
+# longer or uses more memory than recorded in golden/budgets.json fails the check.
+#
+#   python regression.py              check; exit code 1 when something differs
+#   python regression.py --update     store the current results and budgets
+#
+# Run --update only after checking that a change of the results is intended. The
+# budgets are the measured values times a margin (--time-margin, --memory-margin), so
+# a slower computer may need new budgets.
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import tempfile
+import tracemalloc
+import warnings
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from session import Session
+from export import plain_frame
+from overlap import overlap_report
+from provenance import make_input
+from fastcsv import sample_epcr
+from scoring import default_settings, self_report_files
+
+# supress future warnings
+pd.set_option('future.no_silent_downcasting', True)
+warnings.simplefilter(action='ignore', category=FutureWarning)
+
+here = os.path.dirname(os.path.abspath(__file__))
+golden_dir = os.path.join(here, 'golden')
+budgets_file = os.path.join(golden_dir, 'budgets.json')
+
+# budgets below these are raised to them, so very short stages do not fail on noise
+min_seconds = 0.5
+min_memory = 16 * 1024 * 1024
+
+
+def measure(function):
+    # (result, seconds, peak memory in bytes); the time is taken without tracing,
+    # which slows Python code down
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+# -------------------------------------------------------------------
+# Data sets
+
+def fixture_sources():
+    return {'IAR': os.path.join(here, 'iamresponding', 'Report.xls'),
+            'ePCR': os.path.join(here, 'ePCR',
+                                 'Crew-Members-EMS-Incident-Participation-detail_2024-01-29_110315.csv'),
+            'Self-reports': self_report_files(os.path.join(here, 'user reported spreadsheets'))}
+
+
+def make_self_reports(folder, n_members):
+    # copies of the sample spreadsheets, each with another member name; the samples are
+    # sorted, so each member gets the same sample on every computer
+    samples = [load_workbook(f) for f in sorted(self_report_files(os.path.join(here, 'user reported spreadsheets')))]
+    sheet = default_settings['losap_sheet']
+    for i in range(n_members):
+        wb = samples[i % len(samples)]
+        wb[sheet][default_settings['losap_name_pos']] = 'First' + str(i) + ' Member' + str(i)
+        wb.save(os.path.join(folder, 'Member' + str(i) + ' points tracker.xlsx'))
+    return self_report_files(folder)
+
+
+def make_shifts(n_shifts, n_members=300, seed=0):
+    # IAR records as the importer makes them (the report itself is an xlsb workbook,
+    # which cannot be written here)
+    rng = np.random.default_rng(seed)
+    members = np.array(['Member' + str(i) + ', First' + str(i) for i in range(n_members)], dtype=object)
+    start = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 366 * 24, n_shifts), unit='h')
+    hours = rng.choice([6.0, 8.0, 12.0], n_shifts)
+    return make_input(members[rng.integers(0, n_members, n_shifts)], 'Tour of Duty', hours,
+                      start.normalize(), 'generated.xls', np.arange(n_shifts) + 4,
+                      Start=start, End=start + pd.to_timedelta(hours, unit='h'))
+
+
+# -------------------------------------------------------------------
+# Stages
+
+def overlap_counts(report):
+    # calls and activities on a shift per member and category (the whole report of a
+    # large data set is too big to store)
+    counts = report.groupby(['Member Name', 'Category'])['In Shift'].agg(['size', 'sum'])
+    return counts.rename(columns={'size': 'Records', 'sum': 'In Shift'}).reset_index()
+
+
+def run_stages(name, sources, shifts=None, detail=True):
+    # the stages of one data set: {stage: (seconds, peak memory)} and the results;
+    # detail: compare every record, otherwise the summary and the overlaps per member
+    settings = dict(default_settings)
+    timings = {}
+    session = Session()
+    for kind, files in sources.items():
+        _, seconds, peak = measure(lambda: session.read_source(kind, files, settings))
+        timings[name + ': read ' + kind] = (seconds, peak)
+    if shifts is not None:
+        session.frames['IAR'] = shifts
+    summary, seconds, peak = measure(session.rescore)
+    timings[name + ': points'] = (seconds, peak)
+    overlaps, seconds, peak = measure(lambda: overlap_report(session.frames))
+    timings[name + ': overlap report'] = (seconds, peak)
+    if detail:
+        results = {name + ' summary': summary,
+                   name + ' records': session.provenance.records(),
+                   name + ' overlaps': overlaps}
+    else:
+        results = {name + ' summary': summary,
+                   name + ' overlaps per member': overlap_counts(overlaps)}
+    return results, timings
+
+
+def import_order_problem(sources, summary):
+    # None, or the first order of the imports that gives another summary
+    settings = dict(default_settings)
+    for order in itertools.permutations(sources):
+        session = Session()
+        for kind in order:
+            session.read_source(kind, sources[kind], settings)
+        reordered = session.rescore()
+        if as_csv(reordered) == as_csv(summary):
+            continue
+        if len(reordered) != len(summary):
+            return "{} members instead of {} when imported as {}".format(
+                len(reordered), len(summary), ', '.join(order))
+        return "other points when imported as " + ', '.join(order)
+    return None
+
+
+def data_sets(folder, large_rows=200000, large_members=100):
+    yield 'fixtures', fixture_sources(), None, True
+    epcr = os.path.join(folder, 'epcr.csv')
+    sample_epcr(epcr, large_rows)
+    reports = os.path.join(folder, 'self-reports')
+    os.makedirs(reports)
+    yield 'large', {'ePCR': epcr, 'Self-reports': make_self_reports(reports, large_members)}, \
+        make_shifts(large_rows // 4), False
+
+
+# -------------------------------------------------------------------
+# Comparing with the stored results
+
+def golden_file(name):
+    return os.path.join(golden_dir, name + '.csv')
+
+
+def as_csv(df):
+    return plain_frame(df).to_csv(index=False, lineterminator='\n', date_format='%Y-%m-%d %H:%M:%S')
+
+
+def compare(name, df):
+    # None, or what differs from the stored result
+    try:
+        with open(golden_file(name), encoding='utf-8', newline='') as f:
+            expected = f.read()
+    except FileNotFoundError:
+        return "no stored result (run with --update)"
+    current = as_csv(df)
+    if current == expected:
+        return None
+    expected_lines = expected.splitlines()
+    current_lines = current.splitlines()
+    if len(expected_lines) != len(current_lines):
+        return "{} rows instead of {}".format(len(current_lines) - 1, len(expected_lines) - 1)
+    for n, (old, new) in enumerate(zip(expected_lines, current_lines)):
+        if old != new:
+            return "line {}: {!r} instead of {!r}".format(n + 1, new, old)
+
+
+def check_budget(stage, seconds, peak, budgets):
+    budget = budgets.get(stage)
+    if budget is None:
+        return "no budget (run with --update)"
+    problems = []
+    if seconds > budget['seconds']:
+        problems.append("{:.2f} s (budget {:.2f} s)".format(seconds, budget['seconds']))
+    if peak > budget['memory']:
+        problems.append("{:,.0f} KB (budget {:,.0f} KB)".format(peak / 1024, budget['memory'] / 1024))
+    return ', '.join(problems) or None
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="LOSAP Points Calculator regression check")
+    parser.add_argument('--update', action='store_true',
+                        help="store the current results and budgets in " + golden_dir)
+    parser.add_argument('--only', choices=['fixtures', 'large'], help="check one data set")
+    parser.add_argument('--time-margin', type=float, default=3.0,
+                        help="--update: budget = measured time times this")
+    parser.add_argument('--memory-margin', type=float, default=1.5,
+                        help="--update: budget = measured peak memory times this")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    try:
+        with open(budgets_file) as f:
+            budgets = json.load(f)
+    except FileNotFoundError:
+        budgets = {}
+
+    failures = 0
+    folder = tempfile.mkdtemp(prefix='losap-regression-')
+    try:
+        for name, sources, shifts, detail in data_sets(folder):
+            if args.only and name != args.only:
+                continue
+            results, timings = run_stages(name, sources, shifts, detail)
+            if detail:
+                problem = import_order_problem(sources, results[name + ' summary'])
+                failures += problem is not None
+                print('{:32s} {}'.format(name + ': import order', problem or 'ok'))
+            for result, df in results.items():
+                if args.update:
+                    os.makedirs(golden_dir, exist_ok=True)
+                    with open(golden_file(result), 'w', encoding='utf-8', newline='') as f:
+                        f.write(as_csv(df))
+                    problem = None
+                else:
+                    problem = compare(result, df)
+                failures += problem is not None
+                print('{:32s} {}'.format(result, problem or 'ok'))
+            for stage, (seconds, peak) in timings.items():
+                if args.update:
+                    budgets[stage] = {'seconds': round(max(min_seconds, seconds * args.time_margin), 3),
+                                      'memory': int(max(min_memory, peak * args.memory_margin))}
+                    problem = None
+                else:
+                    problem = check_budget(stage, seconds, peak, budgets)
+                failures += problem is not None
+                print('{:32s} {:7.3f} s {:10,.0f} KB  {}'.format(stage, seconds, peak / 1024,
+                                                                 problem or 'ok'))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    if args.update:
+        with open(budgets_file, 'w') as f:
+            json.dump(budgets, f, indent=2, sort_keys=True)
+        print("Results and budgets stored in " + golden_dir)
+        return 0
+    print("{} problems".format(failures) if failures else "All results and budgets ok")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# What-if scenarios: the points of every member under other scoring rules
+#
+# The board asks questions like "what if drills were worth 2 points over 4 hours" or
+# "what if the 20 point Tour of Duty maximum were imposed". A scenario is a set of
+# scoring rules that replace some of the current rules (the keys of default_rules in
+# scoring.py, e.g. {"tour_max": 20} or {"drill_hours": [2, 4]}).
+#
+# The quantities of the records are added up once per member and category. The rules of
+# all scenarios are then applied at once to a scenario x member x category array: the
+# quantities assumed for missing values, the points per unit, the roundings and the
+# maxima. Only the rules that change single records ('hour_steps') go back to the
+# records, once per scenario that uses them. The results are the same as calculating
+# the summary with the rules of each scenario (see scoring.aggregate).
+
+import json
+import numpy as np
+import pandas as pd
+
+from scoring import colnamestoadd, default_rules, make_rules, point_rules, hour_steps
+from history import default_service_rules
+from export import export_table, table_format, write_summary_workbook
+
+# the questions the board asked so far (see README)
+example_scenarios = {
+    'Drills by hours': {'drill_hours': [2, 4]},
+    'Tour of Duty max. 20': {'tour_max': 20},
+    'Calls max. 25': {'calls_max': 25},
+    'Drills by hours, Tour of Duty max. 20': {'drill_hours': [2, 4], 'tour_max': 20},
+}
+
+current_scenario = 'Current rules'
+
+scenario_columns = ['Scenario', 'Members', 'Total Points', 'Average Points', 'Qualifying Members',
+                    'Change in Total Points', 'Change in Qualifying Members']
+
+
+def load_scenarios(file_name):
+    # json object: scenario name -> scoring rules, e.g. {"Tour max. 20": {"tour_max": 20}}
+    with open(file_name) as f:
+        scenarios = json.load(f)
+    if not isinstance(scenarios, dict) or not all(isinstance(r, dict) for r in scenarios.values()):
+        raise ValueError("the scenarios must be a json object of scenario name -> scoring rules")
+    for name, rules in scenarios.items():
+        unknown = sorted(set(rules) - set(default_rules))
+        if unknown:
+            raise ValueError("unknown scoring rule in scenario '" + name + "': " + ', '.join(unknown))
+    return scenarios
+
+
+def rule_array(tables, categories, key, default):
+    # scenarios x categories array of one rule (NaN: not set)
+    values = [[table.get(c, {}).get(key, default) for c in categories] for table in tables]
+    return np.array([[np.nan if v is None else v for v in row] for row in values], dtype=float)
+
+
+def round_where(values, decimals):
+    # values: scenarios x members x categories; decimals: scenarios x categories (NaN: not rounded)
+    for d in np.unique(decimals[~np.isnan(decimals)]):
+        values = np.where((decimals == d)[:, None, :], values.round(int(d)), values)
+    return values
+
+
+class ScenarioSimulator:
+    def __init__(self, frames, rules=None):
+        # frames: source kind -> records as produced by the importers; rules: the current
+        # scoring rules, which the scenarios change
+        self.rules = make_rules(rules)
+        columns = ['Member Name', 'Category', 'Quantity', 'Hours']
+        frames = [df.reindex(columns=columns) for df in frames.values() if len(df) > 0]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+        df = df[df['Member Name'].notna()]
+
+        members = df['Member Name'].astype(str).astype('category')
+        category = df['Category'].astype(str).astype('category')
+        self.members = members.cat.categories
+        self.categories = category.cat.categories
+        self.member_codes = members.cat.codes.to_numpy().astype(np.int64)
+        self.category_codes = category.cat.codes.to_numpy().astype(np.int64)
+        self.hours = df['Hours'].astype(float).to_numpy()
+        self.quantity = df['Quantity'].astype(float).to_numpy()
+
+        # members x categories: the quantities, and the number of records without one
+        shape = (len(self.members), len(self.categories))
+        cells = self.member_codes * len(self.categories) + self.category_codes
+        size = shape[0] * shape[1]
+        self.present = np.bincount(cells, weights=np.nan_to_num(self.quantity), minlength=size).reshape(shape)
+        self.missing = np.bincount(cells, weights=np.isnan(self.quantity), minlength=size).reshape(shape)
+
+    def quantities(self, table):
+        # members x categories: the quantities added up with the rules of one scenario
+        missing = rule_array([table], self.categories, 'missing', 0)[0]
+        totals = self.present + self.missing * np.nan_to_num(missing)
+        for n, col in enumerate(self.categories):
+            steps = table.get(col, {}).get('hour_steps')
+            if steps is None:
+                continue
+            # as scoring.record_quantities: records without hours keep their quantity
+            rows = self.category_codes == n
+            quantity = np.where(np.isnan(self.quantity[rows]), np.nan_to_num(missing[n]), self.quantity[rows])
+            hours = self.hours[rows]
+            quantity = np.where(np.isnan(hours), quantity, hour_steps(hours, steps))
+            totals[:, n] = np.bincount(self.member_codes[rows], weights=quantity,
+                                       minlength=len(self.members))
+        return totals
+
+    def points(self, scenarios):
+        # scenarios: name -> scoring rules that replace the current rules. Returns the
+        # points as a scenarios x members x categories array
+        tables = [point_rules(dict(self.rules, **rules)) for rules in scenarios.values()]
+        values = np.stack([self.quantities(table) for table in tables]) if tables else \
+            np.zeros((0, len(self.members), len(self.categories)))
+        values = round_where(values, rule_array(tables, self.categories, 'round_sum', None))
+        values = values * rule_array(tables, self.categories, 'per_unit', 1)[:, None, :]
+        values = round_where(values, rule_array(tables, self.categories, 'decimals', None))
+        maxima = rule_array(tables, self.categories, 'max', None)
+        return np.minimum(values, np.where(np.isnan(maxima), np.inf, maxima)[:, None, :])
+
+    def totals(self, scenarios):
+        # members x scenarios: the total points (as the 'Total' column of the summary)
+        points = self.points(scenarios)
+        added = np.isin(self.categories, colnamestoadd)
+        totals = points[:, :, added].sum(axis=2).T
+        df = pd.DataFrame(totals, columns=list(scenarios))
+        df.insert(0, 'Member Name', self.members.astype(str))
+        return df.sort_values('Member Name', kind='stable').reset_index(drop=True)
+
+    def compare(self, scenarios, threshold=default_service_rules['threshold']):
+        # (one row per scenario (see scenario_columns), the totals per member). The current
+        # rules come first; the changes are against them
+        scenarios = dict({current_scenario: {}}, **scenarios)
+        totals = self.totals(scenarios)
+        values = totals[list(scenarios)].to_numpy()
+        total = values.sum(axis=0)
+        qualifying = (values >= threshold).sum(axis=0)
+        summary = pd.DataFrame({'Scenario': list(scenarios),
+                                'Members': len(totals),
+                                'Total Points': total.round(2),
+                                'Average Points': (total / max(len(totals), 1)).round(2),
+                                'Qualifying Members': qualifying,
+                                'Change in Total Points': (total - total[0]).round(2),
+                                'Change in Qualifying Members': qualifying - qualifying[0]},
+                               columns=scenario_columns)
+        return summary, totals
+
+
+def write_scenario_report(file_name, summary, totals):
+    # xlsx: the scenarios, then the total of each member in each scenario
+    if table_format(file_name) is None:
+        write_summary_workbook(file_name, summary, 'Scenarios', totals, 'Totals per Member')
+    else:
+        export_table(file_name, summary, totals)
@@ -0,0 +1,358 @@
+# Reading the three data sources and calculating the points
+#
+# This is the part of the program that does not need the user interface, so that the
+# same calculations are used by the main window and by the command line (losap_cli.py).
+# The files are read here, and turned into records (member, category, quantity, date,
+# file and row) by the importers (see importers.py). aggregate() calculates the points
+# of all records of all sources at once, following point_rules(), and returns the
+# summary table plus the records behind the points (see provenance.py).
+
+import os
+import warnings
+import numpy as np
+import pandas as pd
+
+from templates import read_self_report
+from compact import map_names
+from fastcsv import read_csv
+from discovery import Archives, find_files, self_report_patterns
+from provenance import record_columns
+
+__debuggingiar__       = False
+__debuggingepcr__      = False
+__debuggingother__     = False
+
+# columns of the summary table, and the columns that are added up for the total
+#colnames = ["Member Name", "Training", "Drills", "Meetings", "Tour of Duty",
+#            "Misc. Activity", "Calls Responded To", "Position Held", "Disability",
+#            "Total", "SR_Signup", "SR_Calls", "SR_Total"]
+colnames = ["Member Name", "Training", "Drills", "Meetings", "Tour of Duty",
+            "Misc. Activity", "Calls Responded To", "Position Held", "Disability",
+            "Total", "SR_Total"]
+colnamestoadd = ["Training", "Drills", "Meetings", "Tour of Duty",
+                 "Misc. Activity", "Calls Responded To", "Position Held", "Disability"]
+
+# Default settings (these can be changed in the Settings dialog)
+default_settings = {
+    # I am responding
+    'iamr_rows_to_skip': 2,        # Skip this number of rows before reading data
+    'iamr_rows_end': 251,          # Last row containing data (just before 'Name	Total hours')
+    # Member reported spreadsheets (All spreadsheets are present in a single directory)
+    'losap_sheet': 'point tracker',
+    'losap_name_pos': 'D4',        # Position of the person's name
+    'losap_SR_Signups': 'E7',      # Position of the self-reported signup hours
+    'losap_SR_Calls': 'E8',        # Position of the self-reported call hours
+    'losap_rows_to_skip': 9,       # Skip this number of rows before reading data
+    # ePCR
+    'epcr_engine': 'auto',         # CSV parser: 'auto', 'pyarrow' or 'pandas' (see fastcsv.py)
+}
+
+# Scoring rules. Changing these only recalculates the points from the rows that were
+# already read (see session.py); the files are not read again
+default_rules = {
+    'tour_hours_per_point': 12,    # One-half (1/2) point for each 6 hours of scheduled duty
+    'tour_max': None,              # 20 points maximum per year (None: not imposed)
+    'call_points': 0.5,            # 0.5 points to each call responded to
+    'calls_max': None,             # 25 points maximum per year (None: not imposed)
+    'meeting_points': 1,           # 1 point per attendance
+    'disability_max': 5.0,         # Disability points are capped at 5
+    'missing_hours': 1,            # Hours assumed when the Hours field is empty
+    'drill_hours': None,           # [2, 4]: 1 point per drill of 2 hours or more, 2 points if
+                                   #   more than 4 hours (None: the points column is used)
+}
+
+
+def make_rules(rules=None):
+    merged = dict(default_rules)
+    merged.update(rules or {})
+    return merged
+
+
+def empty_summary():
+    return pd.DataFrame(columns=colnames)
+
+
+def fix_name_order(fname):
+    fname = fname.rstrip()
+    if (fname.find(',') > 0) or (fname.find(' ') < 0):
+        return fname
+    # Reverse first and last names
+    new = fname.rsplit(" ",1)
+    return new[1] + ', ' + new[0]
+
+def swap_name_order(df_def):
+    # There appear to be two versions of the spreadsheet out there. In some, names are
+    # entered as "Last, First" and in others, names are the the form of "First Last"
+    # Let's try to rectify this by assuming that a name field containing a comma is in the
+    # corerct form. If not, then we will swap the two name entries and add a comma
+    # **TODO: Distribute a spreadsheet with names in the form: "Last, First"
+    # Names are fixed once per distinct name and kept as a categorical (see compact.py)
+    df_def['Member Name'] = map_names(df_def['Member Name'], fix_name_order)
+    return (df_def)
+
+
+# -------------------------------------------------------------------
+# Read the "Tour of Duty" data from the 'I am responding' data
+#   Read the 'I am responding' exported file (sign-ups)
+#   Skip the first 2 rows, and read until row 251
+#
+# The rows are turned into records (one per shift) by the importer (see importers.py)
+
+def read_iamresponding_file(file_name, rows_to_skip, rows_end):
+
+    # Ignore code warnings
+    warnings.simplefilter(action='ignore', category=UserWarning)
+
+    df_iamr = pd.read_excel(file_name, skiprows=rows_to_skip,
+            nrows=rows_end - rows_to_skip - 1)
+
+    # create a new column with combined names: 'Last name, first name'
+    df_iamr['Member Name'] = df_iamr['Last name'] + ', ' + df_iamr['First name']
+
+    # Fix incorrect full names. e.g. 'Smith, Jon' should be 'Smith, John'
+    # *** TODO: Ask tem to fix Jon's name in IAR
+    df_iamr['Member Name'] = map_names(df_iamr['Member Name'],
+            lambda name: name.replace('Smith, Jon','Smith, John'))
+
+    # where each shift came from (the header is on the row after the skipped rows)
+    df_iamr['Source'] = os.path.basename(file_name)
+    df_iamr['Row'] = rows_to_skip + 2 + np.arange(len(df_iamr))
+    return df_iamr
+
+
+# -------------------------------------------------------------------
+# Read the "Calls Responded To" data from the 'ePCR' data
+
+# only these columns are read; the names and dates repeat and are read as categoricals
+epcr_columns = ['Incident Date', 'Response Incident Number (eResponse.03)',
+                'Incident Crew Member Full Name']
+epcr_category_columns = ['Incident Date', 'Incident Crew Member Full Name']
+
+
+def read_epcr_file(file_name, engine='auto'):
+    # engine: 'pyarrow' (parses on several threads), 'pandas', or 'auto': pyarrow when it
+    # is installed (see fastcsv.py)
+
+    # Ignore code warnings
+    warnings.simplefilter(action='ignore', category=UserWarning)
+
+    df_ePCR = read_csv(file_name, epcr_columns, epcr_category_columns, engine)
+
+    #rename column
+    df_ePCR.rename(columns={"Incident Crew Member Full Name": "Member Name"}, inplace=True)
+
+    # Remove double spaces from the name field and reverse first and last
+    # names: 'Last name, first name'. This is done once per distinct name,
+    # and the names are kept as a categorical (see compact.py)
+    df_ePCR['Member Name'] = map_names(df_ePCR['Member Name'],
+            lambda name: ', '.join(reversed(name.replace('  ', ' ').rsplit(" ", 1))))
+
+    # where each incident came from; row 1 of the csv file is the header
+    df_ePCR['Source'] = os.path.basename(file_name)
+    df_ePCR['Row'] = df_ePCR.index.to_numpy() + 2
+    return df_ePCR
+
+
+# -------------------------------------------------------------------
+# Read member self-reported spreadsheets (all in a single folder, or in a zip archive)
+#       skip first number of rows (defined by 'losap_rows_to_skip')
+#
+# Categories to parse are "Training", "Drills", "Meetings", "Misc Activity"
+# "Tour of Duty", "Calls responded to" and "Positions held" are obtained elsewhere
+
+def self_report_files(directory, manifest_dir=None):
+    # the workbooks in the folder and its subfolders, without the template and the lock
+    # files of open workbooks (see discovery.py)
+    return find_files(directory, self_report_patterns, manifest_dir)
+
+
+def read_self_report_files(files, settings, progress=None, failed=None):
+    # progress(n) is called after each file; reading stops when it returns False
+    # failed: list to add (file, reason) to for the files that cannot be read (e.g. no
+    # 'point tracker' sheet); the other files are still read. Without it, the first
+    # such file stops the import
+
+    # Ignore code warnings
+    warnings.simplefilter(action='ignore', category=UserWarning)
+
+    activity_frames = []
+    sr_rows = []
+    # the files in a zip archive are read into memory (see discovery.py)
+    with Archives() as archives:
+        for n, file_path in enumerate(files, start=1):
+            # the template registry decides where the data are in the workbook
+            try:
+                workbook, summary, layout = read_self_report(archives.source(file_path),
+                        settings['losap_sheet'], settings['losap_rows_to_skip'], settings['losap_name_pos'],
+                        settings['losap_SR_Signups'], settings['losap_SR_Calls'])
+            except Exception as e:
+                if failed is None:
+                    raise
+                print("Error reading " + os.path.basename(file_path) + ":", e)
+                failed.append((file_path, str(e) or type(e).__name__))
+            else:
+                if __debuggingother__:
+                    print(file_path, '(' + layout.name + ')')
+
+                #   The portion of the spreadsheet that contains self-reported hours
+                workbook['Source'] = os.path.basename(file_path)
+                summary['Source'] = os.path.basename(file_path)
+                sr_rows.append(summary)
+                activity_frames.append(workbook)
+
+            if progress is not None and progress(n) is False:
+                break
+
+    if not activity_frames:
+        return pd.DataFrame(), pd.DataFrame()
+    df_losap = pd.concat(activity_frames, ignore_index=True, sort=False)
+    df_losapSR = pd.DataFrame(sr_rows)
+    return df_losap, df_losapSR
+
+
+# -------------------------------------------------------------------
+# Calculate the points of the records of all sources
+
+def point_rules(rules=None):
+    # record category (the summary column) -> how its records are turned into points
+    #   per_unit:   points per unit of quantity (hour, call, attendance, point)
+    #   missing:    quantity of a record without one
+    #   round_sum:  decimals of the quantity summed per member (None: not rounded)
+    #   decimals:   decimals of the points per member (None: not rounded)
+    #   max:        maximum points per member (None: no maximum)
+    #   hour_steps: [h1, h2]: the quantity of a record is 1 from h1 hours and 2 above h2
+    #               hours, from the hours of the record (None: the quantity is used)
+    # Categories that are not listed here count one point per unit
+    rules = make_rules(rules)
+    return {
+        # Tour of Duty (IAR): One-half (1/2) point for each 6 hours of scheduled duty;
+        #   the shift hours are added up and rounded to whole hours first.
+        #   20 points maximum per year, when 'tour_max' is set
+        'Tour of Duty':       {'per_unit': 1 / rules['tour_hours_per_point'], 'round_sum': 0,
+                               'decimals': 2, 'max': rules['tour_max']},
+        # Calls (ePCR): 0.5 points to each call responded to, 25 points maximum per year
+        'Calls Responded To': {'per_unit': rules['call_points'], 'max': rules['calls_max']},
+        # Meetings: 1 point per attendance, irrespective of the meeting duration
+        'Meetings':           {'per_unit': rules['meeting_points']},
+        # Training: 1 point/h with a max of 5 points if less than 20 hours
+        #           1 point/h with a max of 10 points between 20-45 hours
+        #           15 points if more than 45 hours
+        #   Here we will simply calculate the points and not consider annual limits.
+        #   Some members fail to complete the Hours field: we assume the event lasted 1 hour
+        'Training':           {'missing': rules['missing_hours']},
+        # Drills: One (1) point per drill or seminar (minimum two hours duration),
+        #         2 point if more than 4 hours; read from the points column, or
+        #         from the hours when 'drill_hours' is set
+        'Drills':             {'hour_steps': rules['drill_hours']},
+        # Misc: One point per activity for participation in activities
+        'Misc. Activity':     {},
+        # Disability: Read the points from the points column & cap at 5
+        'Disability':         {'max': rules['disability_max']},
+        # Self-reported signup hours and calls (see SR_Total; not part of the total)
+        'SR_Signup':          {'per_unit': 1 / rules['tour_hours_per_point'], 'decimals': 3},
+        'SR_Calls':           {'per_unit': rules['call_points']},
+    }
+
+
+def rule_values(category, table, key, default):
+    # the value of one rule for each record (category: categorical of the record categories)
+    values = {c: table.get(c, {}).get(key, default) for c in category.cat.categories}
+    return category.map(values).astype(float).to_numpy()
+
+
+def hour_steps(hours, steps):
+    # 1 from steps[0] hours, 2 above steps[1] hours
+    return (hours >= steps[0]).astype(float) + (hours > steps[1])
+
+
+def record_quantities(category, quantity, table, hours=None):
+    # the quantity of each record, with the missing quantities filled in. hours: the
+    # hours of each record (NaN: not known), for the categories with 'hour_steps'
+    quantity = quantity.astype(float).to_numpy()
+    quantity = np.where(np.isnan(quantity), rule_values(category, table, 'missing', 0), quantity)
+    if hours is not None:
+        hours = hours.astype(float).to_numpy()
+        for col in category.cat.categories:
+            steps = table.get(col, {}).get('hour_steps')
+            if steps is not None:
+                # records without hours keep their quantity
+                rows = (category == col).to_numpy() & ~np.isnan(hours)
+                quantity[rows] = hour_steps(hours[rows], steps)
+    return quantity
+
+
+def category_points(totals, table):
+    # totals: quantities added up, one row per member and one column per category;
+    # the points of each column after the rounding and maxima of the rule table
+    points = pd.DataFrame(index=totals.index)
+    for col in totals.columns:
+        rule = table.get(col, {})
+        value = totals[col]
+        if rule.get('round_sum') is not None:
+            value = value.round(rule['round_sum'])
+        value = value * rule.get('per_unit', 1)
+        if rule.get('decimals') is not None:
+            value = value.round(rule['decimals'])
+        if rule.get('max') is not None:
+            value = value.clip(upper=rule['max'])
+        points[col] = value
+    return points
+
+
+def summary_table(totals, table):
+    # the summary table (see colnames) of the quantities per member and category
+    points = category_points(totals, table)
+
+    # self-reported points, shown next to the total
+    sr_columns = [c for c in ('SR_Signup', 'SR_Calls') if c in points.columns]
+    if sr_columns:
+        points['SR_Total'] = points[sr_columns].sum(axis=1, min_count=1)
+
+    # reorder the columns, sort and replace NAN with zero
+    summary = pd.DataFrame({'Member Name': points.index.astype(str)})
+    for col in colnames[1:]:
+        if col in points.columns:
+            summary[col] = points[col].to_numpy()
+        else:
+            # no records: zero points ('Position Held' is not imported)
+            summary[col] = 0.0 if col in table else 0
+    summary = summary.sort_values(by=['Member Name']).fillna(0).reset_index(drop=True)
+
+    # add up the points
+    summary['Total'] = summary[colnamestoadd].sum(axis=1)
+    return summary
+
+
+def aggregate(frames, rules=None):
+    # frames: source kind -> records as produced by the importers (see importers.py)
+    # Returns the summary table and, per source kind, the records with their points
+    table = point_rules(rules)
+    frames = {kind: df for kind, df in frames.items() if len(df) > 0}
+    if not frames:
+        return empty_summary(), {}
+
+    df = pd.concat([df.reindex(columns=['Member Name', 'Category', 'Quantity', 'Hours'])
+                    for df in frames.values()], ignore_index=True)
+    df = df[df['Member Name'].notna()]
+    category = df['Category'].astype(str).astype('category').reset_index(drop=True)
+    df = pd.DataFrame({'Member Name': df['Member Name'].astype(str).astype('category').to_numpy(),
+                       'Category': category,
+                       'Quantity': record_quantities(category, df['Quantity'], table, df['Hours'])})
+
+    # one row per member, one column per category
+    totals = df.groupby(['Member Name', 'Category'], observed=True)['Quantity'].sum()
+    summary = summary_table(totals.unstack('Category'), table)
+
+    # the points of each record (not rounded)
+    records = {}
+    for kind, frame in frames.items():
+        category = frame['Category'].astype(str).astype('category')
+        points = record_quantities(category, frame['Quantity'], table, frame.get('Hours')) \
+                 * rule_values(category, table, 'per_unit', 1)
+        records[kind] = pd.DataFrame({'Member Name': frame['Member Name'].to_numpy(),
+                                      'Category': category.to_numpy(),
+                                      'Points': points,
+                                      'Date': frame['Date'].to_numpy(),
+                                      'Source': frame['Source'].to_numpy(),
+                                      'Row': frame['Row'].to_numpy()}, columns=record_columns)
+    return summary, records
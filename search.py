@@ -0,0 +1,100 @@
+# Searching and filtering the member table
+#
+# The search box above the table takes name prefixes and numeric conditions on the
+# point columns, separated by commas, e.g.
+#
+#   bro                     members with a name (last or first) starting with 'bro'
+#   Total < 50              members with fewer than 50 points
+#   smi, Meetings >= 2      both
+#
+# The index is built once per summary: the parts of the member names are kept sorted
+# (lower case), so the members with a name starting with a prefix are one binary
+# search away, and each point column is kept sorted with the row numbers, so a range
+# of values is also found by binary search. Typing in the search box only runs these
+# searches and combines the rows found, instead of comparing the text of every cell.
+
+import re
+import numpy as np
+import pandas as pd
+
+condition_pattern = re.compile(r'^\s*(.+?)\s*(<=|>=|==|!=|=|<|>)\s*(-?[\d.]+)\s*$')
+
+
+class MemberIndex:
+    def __init__(self, df):
+        self.df = df
+        self.n_rows = len(df)
+
+        # the parts of each name ('Brown, Robert' -> 'brown', 'robert'), sorted
+        if 'Member Name' in df.columns:
+            names = pd.Series(df['Member Name'].astype(str).str.lower().to_numpy())
+            parts = names.str.split(r'[,\s]+', regex=True).explode()
+            parts = parts[parts.notna() & (parts != '')]
+        else:
+            parts = pd.Series([], dtype=object)
+        order = np.argsort(parts.to_numpy(dtype=str), kind='stable')
+        self.name_parts = parts.to_numpy(dtype=str)[order]
+        self.name_rows = parts.index.to_numpy(dtype=np.int64)[order]
+
+        # each point column sorted, with the row of each value
+        self.columns = {}
+        for col in df.columns:
+            values = pd.to_numeric(df[col], errors='coerce') if col != 'Member Name' else None
+            if values is not None and values.notna().any():
+                values = values.to_numpy(dtype=float)
+                order = np.argsort(values, kind='stable')
+                order = order[~np.isnan(values[order])]
+                self.columns[col.lower()] = (values[order], order)
+
+    def rows_mask(self, rows):
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[rows] = True
+        return mask
+
+    def prefix_mask(self, prefix):
+        # rows with a name part starting with prefix
+        prefix = prefix.lower()
+        start = np.searchsorted(self.name_parts, prefix, side='left')
+        stop = np.searchsorted(self.name_parts, prefix + '\uffff', side='left')
+        return self.rows_mask(self.name_rows[start:stop])
+
+    def range_mask(self, column, op, value):
+        values, rows = self.columns[column.lower()]
+        if op == '<':
+            found = rows[:np.searchsorted(values, value, side='left')]
+        elif op == '<=':
+            found = rows[:np.searchsorted(values, value, side='right')]
+        elif op == '>':
+            found = rows[np.searchsorted(values, value, side='right'):]
+        elif op == '>=':
+            found = rows[np.searchsorted(values, value, side='left'):]
+        elif op in ('=', '=='):
+            found = rows[np.searchsorted(values, value, side='left'):
+                         np.searchsorted(values, value, side='right')]
+        else:   # '!='
+            return ~self.range_mask(column, '=', value)
+        return self.rows_mask(found)
+
+    def search(self, text):
+        # rows (in table order) matching every part of text; a condition on a column
+        # that is not in the table matches nothing
+        mask = np.ones(self.n_rows, dtype=bool)
+        for part in text.split(','):
+            if not part.strip():
+                continue
+            match = condition_pattern.match(part)
+            if match and match.group(1).lower() in self.columns:
+                try:
+                    mask &= self.range_mask(match.group(1), match.group(2), float(match.group(3)))
+                except ValueError:
+                    mask[:] = False
+            elif match:
+                mask[:] = False
+            else:
+                # every word has to match a part of the name
+                for word in part.split():
+                    mask &= self.prefix_mask(word)
+        return np.flatnonzero(mask)
+
+    def filter(self, text):
+        return self.df.iloc[self.search(text)]
@@ -0,0 +1,350 @@
+# Local HTTP service for scoring jobs
+#
+# Other programs on this computer (e.g. the roster system or a month-end script) can
+# have the points calculated without the main window. A job names the files to import
+# (paths on this computer, as on the command line) and optionally the reader settings
+# and scoring rules:
+#
+#   POST /jobs                  {"period": "2024-01"}    (see Session.import_period), or
+#                               {"iar": "iamresponding/Report.xls",
+#                                "epcr": "ePCR/export.csv",
+#                                "self_reports": "user reported spreadsheets",
+#                                "settings": {"iamr_rows_end": 300},
+#                                "rules": {"tour_max": 20}}
+#                               -> 202 {"id": ..., "status": "queued"}
+#   GET  /jobs                  all jobs and their status
+#   GET  /jobs/<id>             status and the last progress message
+#   GET  /jobs/<id>/events      progress messages (one json object per line) as they
+#                               happen, until the job is finished
+#   GET  /jobs/<id>/result      the summary as json (?records=1 adds the records),
+#                               ?format=xlsx or ?format=csv for a file
+#   DELETE /jobs/<id>           cancel a job that has not started yet
+#
+# Jobs run on a fixed number of worker threads. When too many jobs are waiting, new
+# jobs are refused (503) instead of queued. Start with
+#
+#   python server.py --port 8765 --workers 2
+#
+# The server only listens on this computer (127.0.0.1) unless --host is given.
+
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pandas as pd
+
+from cache import ResultCache, default_cache_dir
+from export import plain_frame, write_summary_workbook
+from session import Session
+from scoring import default_settings, self_report_files
+from discovery import is_archive
+
+# supress future warnings
+pd.set_option('future.no_silent_downcasting', True)
+warnings.simplefilter(action='ignore', category=FutureWarning)
+
+finished_states = ('done', 'failed', 'cancelled')
+
+
+class Job:
+    def __init__(self, spec):
+        self.id = uuid.uuid4().hex[:12]
+        self.spec = spec
+        self.status = 'queued'
+        self.created = time.time()
+        self.events = []
+        self.session = None
+        self.error = None
+        self.future = None
+        self.changed = threading.Condition()
+
+    def report(self, **event):
+        # add a progress message and wake up the clients following the events
+        with self.changed:
+            if 'status' in event:
+                self.status = event['status']
+            event['time'] = round(time.time() - self.created, 3)
+            self.events.append(event)
+            self.changed.notify_all()
+
+    def finished(self):
+        return self.status in finished_states
+
+    def info(self):
+        info = {'id': self.id, 'status': self.status,
+                'progress': self.events[-1] if self.events else None}
+        if self.error:
+            info['error'] = self.error
+        if self.status == 'done':
+            info['members'] = len(self.session.summary)
+            info['anomalies'] = len(self.session.anomalies)
+            info['failed'] = [{'source': kind, 'file': file_name, 'reason': reason}
+                              for kind, file_name, reason in self.session.failed_files()]
+        return info
+
+
+def check_spec(spec):
+    # the reason a job cannot be run, or None
+    if not isinstance(spec, dict):
+        return "the job must be a json object"
+    if not any(spec.get(kind) for kind in ('iar', 'epcr', 'self_reports', 'period')):
+        return "nothing to import: give 'period', 'iar', 'epcr' and/or 'self_reports'"
+    for kind in ('iar', 'epcr'):
+        if spec.get(kind) and not os.path.isfile(spec[kind]):
+            return "file not found: " + str(spec[kind])
+    if spec.get('self_reports') and not (os.path.isdir(spec['self_reports'])
+                                         or is_archive(spec['self_reports'])):
+        return "folder or zip file not found: " + str(spec['self_reports'])
+    if spec.get('period') and not os.path.isdir(spec['period']):
+        return "folder not found: " + str(spec['period'])
+    for key in ('settings', 'rules', 'validation_rules'):
+        if key in spec and not isinstance(spec[key], dict):
+            return "'" + key + "' must be a json object"
+    return None
+
+
+def run_job(job, cache):
+    job.report(status='running')
+    spec = job.spec
+    settings = dict(default_settings)
+    settings.update(spec.get('settings') or {})
+    session = Session(cache=cache)
+    session.validation_rules = spec.get('validation_rules')
+    try:
+        if spec.get('period'):
+            job.report(stage='Period', folder=spec['period'])
+
+            def period_progress(kind, n):
+                job.report(stage=kind, done=n)
+
+            for kind, problem in session.import_period(spec['period'], settings, period_progress).items():
+                job.report(stage=kind, problem=problem)
+        if spec.get('iar'):
+            job.report(stage='IAR', file=os.path.basename(spec['iar']))
+            session.read_source('IAR', spec['iar'], settings)
+        if spec.get('epcr'):
+            job.report(stage='ePCR', file=os.path.basename(spec['epcr']))
+            session.read_source('ePCR', spec['epcr'], settings)
+        if spec.get('self_reports'):
+            files = self_report_files(spec['self_reports'])
+            job.report(stage='Self-reports', done=0, total=len(files))
+
+            def progress(n):
+                job.report(stage='Self-reports', done=n, total=len(files))
+
+            session.read_source('Self-reports', files, settings, progress)
+        session.set_rules(spec.get('rules'))
+        job.session = session
+        job.report(status='done', members=len(session.summary))
+    except Exception as e:
+        print("Error in job " + job.id + ":", e)
+        job.error = str(e)
+        job.report(status='failed', error=str(e))
+
+
+class JobServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, workers=2, max_pending=20, max_jobs=100, cache=None):
+        super(JobServer, self).__init__(address, JobHandler)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.max_pending = max_pending      # jobs waiting or running
+        self.max_jobs = max_jobs            # jobs kept, including the finished ones
+        self.cache = cache
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, spec):
+        with self.lock:
+            pending = sum(1 for job in self.jobs.values() if not job.finished())
+            if pending >= self.max_pending:
+                return None
+            job = Job(spec)
+            self.jobs[job.id] = job
+            # forget the oldest finished jobs
+            finished = [key for key, old in self.jobs.items() if old.finished()]
+            for key in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+                del self.jobs[key]
+        job.report(status='queued')
+        job.future = self.executor.submit(run_job, job, self.cache)
+        return job
+
+    def cancel(self, job):
+        # only jobs that have not started can be cancelled
+        if job.future is not None and job.future.cancel():
+            job.report(status='cancelled')
+            return True
+        return False
+
+    def server_close(self):
+        super(JobServer, self).server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    server_version = 'LOSAP/1.0'
+
+    def send_json(self, value, status=200):
+        body = json.dumps(value, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_json({'error': message}, status)
+
+    def find_job(self, job_id):
+        job = self.server.jobs.get(job_id)
+        if job is None:
+            self.send_error_json(404, "no such job: " + job_id)
+        return job
+
+    def route(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        return parts, query
+
+    def do_POST(self):
+        parts, _ = self.route()
+        if parts != ['jobs']:
+            return self.send_error_json(404, "unknown address: " + self.path)
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            spec = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            return self.send_error_json(400, "the job is not valid json: " + str(e))
+        problem = check_spec(spec)
+        if problem:
+            return self.send_error_json(400, problem)
+        job = self.server.submit(spec)
+        if job is None:
+            self.send_response(503)
+            self.send_header('Retry-After', '5')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_json(dict(job.info(), url='/jobs/' + job.id), 202)
+
+    def do_DELETE(self):
+        parts, _ = self.route()
+        if len(parts) != 2 or parts[0] != 'jobs':
+            return self.send_error_json(404, "unknown address: " + self.path)
+        job = self.find_job(parts[1])
+        if job is None:
+            return
+        if not self.server.cancel(job):
+            return self.send_error_json(409, "the job has already started")
+        self.send_json(job.info())
+
+    def do_GET(self):
+        parts, query = self.route()
+        if parts == ['jobs']:
+            return self.send_json([job.info() for job in list(self.server.jobs.values())])
+        if len(parts) < 2 or parts[0] != 'jobs':
+            return self.send_error_json(404, "unknown address: " + self.path)
+        job = self.find_job(parts[1])
+        if job is None:
+            return
+        if len(parts) == 2:
+            return self.send_json(job.info())
+        if parts[2:] == ['events']:
+            return self.send_events(job)
+        if parts[2:] == ['result']:
+            return self.send_result(job, query)
+        self.send_error_json(404, "unknown address: " + self.path)
+
+    def send_events(self, job):
+        # one json object per line, sent as they happen; the response ends with the job
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        sent = 0
+        while True:
+            with job.changed:
+                while sent == len(job.events) and not job.finished():
+                    job.changed.wait(timeout=15)
+                events = job.events[sent:]
+                finished = job.finished()
+            for event in events:
+                self.wfile.write(json.dumps(event, default=str).encode() + b'\n')
+            self.wfile.flush()
+            sent += len(events)
+            if finished and sent == len(job.events):
+                break
+        self.close_connection = True
+
+    def send_result(self, job, query):
+        if job.status == 'failed':
+            return self.send_error_json(500, job.error)
+        if job.status != 'done':
+            return self.send_error_json(409, "the job is " + job.status)
+        summary = job.session.summary
+        fmt = query.get('format', 'json')
+        records = job.session.provenance.records() if query.get('records') in ('1', 'true') else None
+        if fmt == 'json':
+            result = {'summary': json.loads(plain_frame(summary).to_json(orient='records'))}
+            if records is not None:
+                result['records'] = json.loads(plain_frame(records).to_json(
+                        orient='records', date_format='iso'))
+            return self.send_json(result)
+        if fmt == 'xlsx':
+            output = io.BytesIO()
+            write_summary_workbook(output, summary, 'Points Summary', records)
+            body = output.getvalue()
+            content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        elif fmt == 'csv':
+            body = plain_frame(summary).to_csv(index=False).encode()
+            content_type = 'text/csv'
+        else:
+            return self.send_error_json(400, "unknown format: " + fmt)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Content-Disposition',
+                         'attachment; filename="points-' + job.id + '.' + fmt + '"')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="LOSAP Points Calculator service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=2, help="jobs run at the same time")
+    parser.add_argument('--max-pending', type=int, default=20,
+                        help="jobs waiting or running before new jobs are refused")
+    parser.add_argument('--cache-dir', default=default_cache_dir,
+                        help="folder with the rows read before (default: %(default)s)")
+    parser.add_argument('--no-cache', action='store_true', help="always read the files")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    cache = None if args.no_cache else ResultCache(args.cache_dir)
+    server = JobServer((args.host, args.port), args.workers, args.max_pending, cache=cache)
+    print("Listening on http://" + args.host + ":" + str(server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
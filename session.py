@@ -0,0 +1,278 @@
+# The rows read from the imported files, kept between calculations
+#
+# Reading the files (the xlsb report, the csv export and one workbook per member) is
+# the slow part of the import. The records read by the importer of each source (see
+# importers.py) are kept here, so when a scoring rule changes the summary is
+# calculated again from memory. The files are only read again when a setting that
+# changes what is read from them (the reader settings of that source) changes.
+#
+# With a cache (see cache.py), files that were read before with the same settings are
+# not read at all.
+#
+# A session can be saved to a file and opened again, e.g. to look at the results of a
+# previous period without the original files.
+
+import os
+import pickle
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+from compact import compact_activities
+from importers import get_importer, importer_registry, period_paths
+from provenance import ProvenanceIndex, input_columns
+from timeline import Timeline
+from validation import validate_activities
+from scoring import empty_summary, make_rules, aggregate
+
+session_version = 2
+
+
+class Session:
+    def __init__(self, rules=None, cache=None):
+        self.rules = make_rules(rules)
+        self.cache = cache      # ResultCache or None
+        self.frames = {}        # source kind -> records read from the files
+        self.files = {}         # source kind -> file name, or list of files
+        self.settings = {}      # source kind -> reader settings used for the files
+        self.anomalies = validate_activities(None)  # problems in the self-reported activities
+        self.failed = {}        # source kind -> (file, reason) of the files that could not be read
+        self.validation_rules = None
+        self.provenance = ProvenanceIndex()
+        self.summary = empty_summary()
+        self._timeline = None
+
+    def clear(self):
+        self.frames = {}
+        self.files = {}
+        self.settings = {}
+        self.anomalies = validate_activities(None)
+        self.failed = {}
+        self.provenance.clear()
+        self.summary = empty_summary()
+        self._timeline = None
+
+    # ---------------------------------------------------------------
+    # Reading the files
+
+    def import_iamresponding(self, file_name, settings):
+        self.read_source('IAR', file_name, settings)
+        return self.rescore()
+
+    def import_epcr(self, file_name, settings=None):
+        self.read_source('ePCR', file_name, settings or {})
+        return self.rescore()
+
+    def import_self_reports(self, files, settings, progress=None):
+        # progress(n) is called after each file; reading stops when it returns False
+        if not self.read_source('Self-reports', list(files), settings, progress):
+            return None
+        return self.rescore()
+
+    def import_path(self, kind, path, settings, progress=None):
+        # the file or folder chosen by the user, for any registered importer
+        files = get_importer(kind).find_files(path)
+        if not self.read_source(kind, files, settings, progress):
+            return None
+        return self.rescore()
+
+    def reader_config(self, kind, settings):
+        # everything that changes the records read from the files of this source
+        settings = dict(settings, validation_rules=self.validation_rules)
+        return {key: settings.get(key) for key in get_importer(kind).reader_keys}
+
+    def read_source(self, kind, files, settings, progress=None):
+        # Read the files of one source and keep the records; False if nothing was read
+        result = self.read_files(kind, files, settings, progress)
+        if result is None:
+            return False
+        self._keep(kind, *result)
+        return True
+
+    def read_files(self, kind, files, settings, progress=None):
+        # (records, anomalies, failed files, files, reader settings) of one source, or None
+        # if nothing was read. Only the cache is used, so sources can be read at the same time
+        config = self.reader_config(kind, settings)
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(kind, files, config)
+            cached = self.cache.get(key)
+            if cached is not None:
+                frame, anomalies = cached
+                return frame, anomalies, [], files, config
+
+        complete = True
+
+        def read_progress(n):
+            nonlocal complete
+            if progress is not None and progress(n) is False:
+                complete = False
+                return False
+            return True
+
+        problems = []
+        failed = []
+        frames = list(get_importer(kind).read(files, dict(settings, **config),
+                                              read_progress, problems, failed))
+        if not frames or sum(len(df) for df in frames) == 0:
+            if not failed:
+                return None
+            # only files that could not be read: kept, so they can be read again
+            frame = pd.DataFrame(columns=input_columns)
+        else:
+            frame = compact_activities(pd.concat(frames, ignore_index=True))
+        anomalies = pd.concat(problems, ignore_index=True) if problems else None
+
+        # an import that was cancelled half-way, or with files that could not be read,
+        # is not cached
+        if key is not None and complete and not failed:
+            try:
+                self.cache.put(key, (frame, anomalies))
+            except OSError as e:
+                print("Error writing the cache:", e)
+        return frame, anomalies, failed, files, config
+
+    def read_sources(self, paths, settings, progress=None):
+        # Read several sources at the same time (one thread per source) and keep the
+        # records of all of them. paths: source kind -> file or folder (see
+        # importers.period_paths). progress(kind, n) is called after each file of the
+        # sources that read more than one file. Returns the problems per source kind
+        errors = {}
+        with ThreadPoolExecutor(max_workers=max(1, len(paths))) as executor:
+            futures = {}
+            for kind, path in paths.items():
+                files = get_importer(kind).find_files(path)
+                kind_progress = None if progress is None else partial(progress, kind)
+                futures[kind] = executor.submit(self.read_files, kind, files, settings, kind_progress)
+            for kind, future in futures.items():
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print("Error reading " + kind + ":", e)
+                    errors[kind] = str(e)
+                    continue
+                if result is None:
+                    errors[kind] = "nothing to import"
+                else:
+                    self._keep(kind, *result)
+        return errors
+
+    def import_period(self, folder, settings, progress=None):
+        # all sources of one period, e.g. the folder with the 'iamresponding', 'ePCR'
+        # and 'user reported spreadsheets' folders; the points are calculated once, at
+        # the end. The records of earlier imports are dropped. Returns the problems per
+        # source kind
+        self.clear()
+        paths = period_paths(folder)
+        errors = self.read_sources(paths, settings, progress)
+        for kind in importer_registry:
+            if kind not in paths and get_importer(kind).period_folder:
+                errors[kind] = "not found in " + folder
+        self.rescore()
+        return errors
+
+    def _keep(self, kind, frame, anomalies, failed, files, config):
+        self.frames[kind] = frame
+        self._timeline = None
+        self.files[kind] = files
+        self.settings[kind] = config
+        self.failed[kind] = failed
+        if anomalies is not None:
+            self.anomalies = anomalies
+
+    def failed_files(self):
+        # (source kind, file, reason) of every file that could not be read
+        return [(kind, file_name, reason) for kind, failed in self.failed.items()
+                for file_name, reason in failed]
+
+    def retry_failed(self, kind, settings, progress=None):
+        # Read only the files of a source that could not be read before (e.g. after they
+        # were fixed), and add their records to those of the other files. Returns the
+        # summary, or None when there was nothing to read again
+        failed_files = [file_name for file_name, _ in self.failed.get(kind, [])]
+        if not failed_files:
+            return None
+        if self.settings[kind] != self.reader_config(kind, settings):
+            # the other files were read with other settings: read them all again
+            self.read_source(kind, self.files[kind], settings, progress)
+            return self.rescore()
+        result = self.read_files(kind, failed_files, settings, progress)
+        if result is None:
+            self.failed[kind] = []
+            return self.rescore()
+        frame, anomalies, failed, _, config = result
+        frames = [df for df in (self.frames[kind], frame) if len(df) > 0]
+        if len(frames) > 1:
+            frame = compact_activities(pd.concat(frames, ignore_index=True))
+        elif frames:
+            frame = frames[0]
+        if anomalies is not None:
+            anomalies = pd.concat([self.anomalies, anomalies], ignore_index=True)
+        self._keep(kind, frame, anomalies, failed, self.files[kind], config)
+        return self.rescore()
+
+    def changed_sources(self, settings):
+        # the sources whose files were read with other reader settings
+        return [kind for kind in self.frames
+                if self.settings[kind] != self.reader_config(kind, settings)]
+
+    def update_settings(self, settings):
+        # Read the files again only for the sources whose reader settings changed.
+        # Returns the sources that were read again
+        changed = self.changed_sources(settings)
+        for kind in changed:
+            if not self.read_source(kind, self.files[kind], settings):
+                # nothing left to read with these settings
+                del self.frames[kind], self.files[kind], self.settings[kind]
+                self.failed.pop(kind, None)
+        if changed:
+            self.rescore()
+        return changed
+
+    # ---------------------------------------------------------------
+    # Calculating the points from the records that were read
+
+    def set_rules(self, rules):
+        self.rules = make_rules(rules)
+        return self.rescore()
+
+    def rescore(self):
+        # the points of all sources at once (see scoring.aggregate)
+        self.summary, records = aggregate(self.frames, self.rules)
+        self.provenance.clear()
+        for kind, df in records.items():
+            self.provenance.set_records(kind, df)
+        self._timeline = None
+        return self.summary
+
+    def timeline(self):
+        # the records by date, for the points of any date range (see timeline.py)
+        if self._timeline is None:
+            self._timeline = Timeline(self.frames, self.rules)
+        return self._timeline
+
+    # ---------------------------------------------------------------
+    # Saving and opening
+
+    def save(self, file_name):
+        state = {'version': session_version, 'rules': self.rules, 'frames': self.frames,
+                 'files': self.files, 'settings': self.settings,
+                 'anomalies': self.anomalies, 'failed': self.failed}
+        with open(file_name, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, file_name, cache=None):
+        # only open session files written by this program (pickle)
+        with open(file_name, 'rb') as f:
+            state = pickle.load(f)
+        if state.get('version') != session_version:
+            raise ValueError(os.path.basename(file_name) + " is not a session file of this version")
+        session = cls(state['rules'], cache)
+        session.frames = state['frames']
+        session.files = state['files']
+        session.settings = state['settings']
+        session.anomalies = state['anomalies']
+        session.failed = state.get('failed', {})
+        session.rescore()
+        return session
@@ -0,0 +1,182 @@
+# A statement of the points of each member
+#
+# Each member gets a statement with the points per category and the total, followed by
+# the records behind the points (date, category, points, file) when they are known. The
+# statements are written as HTML pages, or as PDF files made from the same page by Qt
+# (QTextDocument and QPdfWriter, so no other package is needed).
+#
+# The members are divided into chunks that are written by a pool of processes, so the
+# statements of a whole roster are written at the same time on all processors. Each
+# process gets the rows of the members of its chunk and writes their files itself.
+
+import os
+import html
+import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from scoring import colnamestoadd
+from export import header_colors, even_row_color, invalid_sheet_chars
+
+statement_formats = ('html', 'pdf')
+
+# members per task sent to a process
+chunk_size = 25
+
+record_columns = ['Date', 'Category', 'Points', 'Source', 'Row']
+
+style = """
+body { font-family: Arial, Helvetica, sans-serif; font-size: 10pt; }
+h1 { font-size: 16pt; }
+table { border-collapse: collapse; margin-bottom: 12pt; }
+th { background-color: %s; color: %s; text-align: left; padding: 3px 8px; }
+td { padding: 3px 8px; }
+td.number { text-align: right; }
+tr.even td { background-color: %s; }
+tr.total td { font-weight: bold; border-top: 1px solid black; }
+""" % (header_colors['bg_color'], header_colors['font_color'], even_row_color)
+
+
+def file_name(folder, member, fmt):
+    # 'Smith, John' -> '<folder>/Smith, John.pdf'
+    name = ''.join('_' if c in invalid_sheet_chars + '<>"|' else c for c in str(member)).strip() or 'member'
+    return os.path.join(folder, name + '.' + fmt)
+
+
+def file_names(folder, members, fmt):
+    # one file per member; members whose names give the same file name (e.g. 'A/B' and
+    # 'A_B', or names differing only in case) get ' (2)', ' (3)', ... added
+    used = set()
+    paths = []
+    for member in members:
+        path = file_name(folder, member, fmt)
+        base, ext = os.path.splitext(path)
+        n = 1
+        while path.lower() in used:
+            n += 1
+            path = base + ' (' + str(n) + ')' + ext
+        used.add(path.lower())
+        paths.append(path)
+    return paths
+
+
+def number(value):
+    try:
+        return '{:.2f}'.format(float(value))
+    except (TypeError, ValueError):
+        return ''
+
+
+def table(header, rows, numeric=(), total=None):
+    # rows: lists of values; numeric: the columns shown as numbers
+    lines = ['<table>', '<tr>' + ''.join('<th>' + html.escape(h) + '</th>' for h in header) + '</tr>']
+    for n, row in enumerate(rows, start=1):
+        cells = []
+        for i, value in enumerate(row):
+            if i in numeric:
+                cells.append('<td class="number">' + number(value) + '</td>')
+            else:
+                cells.append('<td>' + html.escape('' if value is None else str(value)) + '</td>')
+        lines.append('<tr class="' + ('even' if n % 2 == 0 else 'odd') + '">' + ''.join(cells) + '</tr>')
+    if total is not None:
+        lines.append('<tr class="total">' + ''.join(
+            '<td class="number">' + number(v) + '</td>' if i in numeric else '<td>' + html.escape(str(v)) + '</td>'
+            for i, v in enumerate(total)) + '</tr>')
+    lines.append('</table>')
+    return '\n'.join(lines)
+
+
+def statement_html(member, points, records=None, title='LOSAP Points Statement', period=None):
+    # points: summary row of the member (column -> value); records: the member's records
+    # as lists of record_columns values, or None
+    heading = html.escape(title) + (' ' + html.escape(str(period)) if period else '')
+    parts = ['<html><head><meta charset="utf-8"><title>' + heading + '</title>',
+             '<style>' + style + '</style></head><body>',
+             '<h1>' + heading + '</h1>',
+             '<p><b>' + html.escape(str(member)) + '</b><br>Printed ' +
+             datetime.date.today().isoformat() + '</p>',
+             table(['Category', 'Points'], [[col, points.get(col, 0)] for col in colnamestoadd],
+                   numeric=(1,), total=['Total', points.get('Total', 0)])]
+    if records:
+        parts.append('<h2>Records</h2>')
+        rows = [[str(r[0])[:10] if r[0] is not None else ''] + list(r[1:]) for r in records]
+        parts.append(table(record_columns, rows, numeric=(2,)))
+    parts.append('</body></html>')
+    return '\n'.join(parts)
+
+
+# -------------------------------------------------------------------
+# Writing the files, in the processes of the pool
+
+_app = None
+
+
+def start_worker(fmt):
+    # PDF files are made by Qt, which needs an application object (without a screen)
+    global _app
+    if fmt == 'pdf':
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtGui import QGuiApplication
+        _app = QGuiApplication.instance() or QGuiApplication(['statements'])
+
+
+def write_pdf(page, path):
+    from PyQt5.QtGui import QTextDocument, QPdfWriter, QPageSize
+    document = QTextDocument()
+    document.setHtml(page)
+    writer = QPdfWriter(path)
+    writer.setPageSize(QPageSize(QPageSize.Letter))
+    document.print_(writer)
+
+
+def write_chunk(fmt, members, title, period):
+    # members: (name, summary row, records, file) of the members of one chunk
+    if fmt == 'pdf' and _app is None:
+        start_worker(fmt)
+    written = []
+    for member, points, records, path in members:
+        page = statement_html(member, points, records, title, period)
+        if fmt == 'pdf':
+            write_pdf(page, path)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(page)
+        written.append(path)
+    return written
+
+
+def member_chunks(summary, paths, provenance=None):
+    # the rows and file of each member, chunk_size members at a time
+    chunk = []
+    for points, path in zip(summary.to_dict('records'), paths):
+        member = points['Member Name']
+        records = None
+        if provenance is not None:
+            df = provenance.member(member)
+            records = df.reindex(columns=record_columns).astype(object).where(df.notna(), None)
+            records = records.values.tolist()
+        chunk.append((member, points, records, path))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_statements(folder, summary, provenance=None, fmt='html', title='LOSAP Points Statement',
+                     period=None, workers=None, progress=None):
+    # One file per member in folder; returns the files written. provenance: the records
+    # behind the points (see provenance.py), or None. progress(n) is called with the
+    # number of statements written so far
+    if fmt not in statement_formats:
+        raise ValueError('Unknown statement format: ' + str(fmt))
+    os.makedirs(folder, exist_ok=True)
+    paths = file_names(folder, summary['Member Name'], fmt)
+    written = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=start_worker, initargs=(fmt,)) as executor:
+        futures = [executor.submit(write_chunk, fmt, chunk, title, period)
+                   for chunk in member_chunks(summary, paths, provenance)]
+        for future in as_completed(futures):
+            written.extend(future.result())
+            if progress is not None:
+                progress(len(written))
+    return sorted(written)
@@ -0,0 +1,159 @@
+# Registry of the member self-report ('points tracker') templates
+#
+# Several versions of the points tracker spreadsheet are in circulation. Rather than
+# patching column names after reading, every known version is registered here with its
+# header row and cell layout. A workbook is fingerprinted by the text of its header row
+# (and the labels next to the name / self-reported cells), and the fingerprint is looked
+# up in a precomputed dictionary to find the layout to use for extracting the data.
+# Workbooks that do not match any known version are read with the positions entered in
+# the Settings dialog.
+
+from openpyxl import load_workbook
+from openpyxl.utils.cell import coordinate_to_tuple
+import pandas as pd
+
+# Column names used by the rest of the program for the activity rows
+activity_columns = ['Date', 'Activity', 'Activity code', 'Description', 'Hours',
+                    'Points', 'Notes/Questions']
+
+# Known header texts (after normalizing, see below) and the column they correspond to
+header_aliases = {
+    'date': 'Date',
+    'activity': 'Activity',
+    'activity (not hours & calls)': 'Activity',
+    'activity code': 'Activity code',
+    'description': 'Description',
+    'hours': 'Hours',
+    'time spent (in hours)': 'Hours',
+    'points': 'Points',
+    'notes/questions': 'Notes/Questions',
+}
+
+
+def normalize_header(value):
+    # 'Activity \n(not hours & calls)' -> 'activity (not hours & calls)'
+    if value is None:
+        return ''
+    return ' '.join(str(value).split()).lower()
+
+
+def get_cell(rows, pos):
+    # rows are 1-based in Excel, pos is a (row, column) tuple
+    r, c = pos
+    if r <= len(rows) and c <= len(rows[r - 1]):
+        return rows[r - 1][c - 1]
+    return None
+
+
+class TemplateLayout:
+    def __init__(self, name, header_row, headers, name_pos='D4', signups_pos='E7',
+                 calls_pos='E8', labels=None):
+        self.name = name
+        self.header_row = header_row
+        self.headers = tuple(normalize_header(h) for h in headers)
+        # canonical column name for each spreadsheet column (None = not used)
+        self.columns = [header_aliases.get(h) for h in self.headers]
+        self.name_pos = coordinate_to_tuple(name_pos)
+        self.signups_pos = coordinate_to_tuple(signups_pos)
+        self.calls_pos = coordinate_to_tuple(calls_pos)
+        self.labels = {coordinate_to_tuple(k): normalize_header(v)
+                       for k, v in (labels or {}).items()}
+
+    def key(self):
+        return (self.header_row, self.headers)
+
+    def labels_match(self, rows):
+        for pos, text in self.labels.items():
+            if normalize_header(get_cell(rows, pos)) != text:
+                return False
+        return True
+
+
+# fingerprint -> layout, and the header rows that need to be looked at
+template_registry = {}
+template_header_rows = []
+
+
+def register_template(layout):
+    template_registry[layout.key()] = layout
+    if layout.header_row not in template_header_rows:
+        template_header_rows.append(layout.header_row)
+        template_header_rows.sort()
+
+
+tracker_labels = {'B4': 'Name', 'B7': 'Duty hours', 'B8': 'Respond to calls'}
+
+# Original tracker: no points column, points are derived from the hours
+register_template(TemplateLayout('points tracker (hours)', 11,
+        ['Date', 'Activity \n(not hours & calls)', 'Activity code', 'Description ',
+         'time spent \n(in hours)', 'Notes/Questions'],
+        labels=tracker_labels))
+
+# Tracker with a points column (drills, misc. activity and disability are read from it)
+register_template(TemplateLayout('points tracker (points)', 11,
+        ['Date', 'Activity \n(not hours & calls)', 'Activity code', 'Description ',
+         'time spent \n(in hours)', 'Points', 'Notes/Questions'],
+        labels=tracker_labels))
+
+
+def settings_layout(rows, rows_to_skip, name_pos, signups_pos, calls_pos):
+    # Layout built from the Settings dialog: the header is the first non-blank row
+    # after the rows to skip, and its columns are matched by name
+    header_row = rows_to_skip + 1
+    while header_row <= len(rows) and not any(v is not None for v in rows[header_row - 1]):
+        header_row += 1
+    headers = rows[header_row - 1] if header_row <= len(rows) else ()
+    return TemplateLayout('settings', header_row, headers, name_pos, signups_pos, calls_pos)
+
+
+def identify_template(rows):
+    for header_row in template_header_rows:
+        if header_row > len(rows):
+            break
+        headers = tuple(normalize_header(h) for h in rows[header_row - 1])
+        # ignore empty trailing columns
+        while headers and headers[-1] == '':
+            headers = headers[:-1]
+        layout = template_registry.get((header_row, headers))
+        if layout is not None and layout.labels_match(rows):
+            return layout
+    return None
+
+
+# -------------------------------------------------------------------
+# Read one self-report workbook
+#   Returns the activity rows (with canonical column names and the Excel row number),
+#   the self-reported summary ('Member Name', 'SR_Signup', 'SR_Calls' and the rows of
+#   these cells) and the layout that was used
+
+def read_self_report(source, sheet_name, rows_to_skip, name_pos, signups_pos, calls_pos):
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = [tuple(r) for r in wb[sheet_name].iter_rows(values_only=True)]
+    finally:
+        wb.close()
+
+    layout = identify_template(rows)
+    if layout is None:
+        layout = settings_layout(rows, rows_to_skip, name_pos, signups_pos, calls_pos)
+
+    member = get_cell(rows, layout.name_pos)
+    summary = {'Member Name': str(member),
+               'SR_Signup': get_cell(rows, layout.signups_pos),
+               'SR_Calls': get_cell(rows, layout.calls_pos),
+               'Signup Row': layout.signups_pos[0],
+               'Calls Row': layout.calls_pos[0]}
+
+    used = [(i, col) for i, col in enumerate(layout.columns) if col is not None]
+    data = []
+    row_numbers = []
+    for n, row in enumerate(rows[layout.header_row:], start=layout.header_row + 1):
+        values = [row[i] if i < len(row) else None for i, _ in used]
+        if any(v is not None for v in values):
+            data.append(values)
+            row_numbers.append(n)
+    df = pd.DataFrame(data, columns=[col for _, col in used])
+    df = df.reindex(columns=activity_columns)
+    df['Row'] = row_numbers
+    df['Member Name'] = member
+    return df, summary, layout
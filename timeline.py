@@ -0,0 +1,105 @@
+# Points for any date range, from the records of a session
+#
+# The records of all sources (see importers.py) are kept sorted by member and date,
+# with a running total of the quantities of each category (hours, calls, points) over
+# the rows. The quantities of a member between two dates are the difference of the
+# running totals at the first and the last row in the range, and those rows are found
+# by binary search, for all members at once. A quarter, a fiscal year or any other range
+# is totaled without reading the files again, and the points are calculated with the
+# same rules (rounding, maxima) as for an import of only the records in that range.
+#
+# Records without a date (the self-reported signups and calls) are not in the timeline.
+
+import numpy as np
+import pandas as pd
+
+from scoring import point_rules, record_quantities, summary_table, empty_summary
+
+
+class Timeline:
+    def __init__(self, frames, rules=None):
+        # frames: source kind -> records as produced by the importers
+        self.table = point_rules(rules)
+        columns = ['Member Name', 'Category', 'Quantity', 'Date', 'Hours']
+        frames = [df.reindex(columns=columns) for df in frames.values() if len(df) > 0]
+        if frames:
+            df = pd.concat(frames, ignore_index=True)
+        else:
+            df = pd.DataFrame(columns=columns)
+        dates = pd.to_datetime(df['Date'], errors='coerce')
+        df = df[df['Member Name'].notna() & dates.notna()]
+        days = dates[df.index].to_numpy().astype('datetime64[D]').astype(np.int64)
+
+        members = df['Member Name'].astype(str).astype('category')
+        category = df['Category'].astype(str).astype('category')
+        quantity = record_quantities(category, df['Quantity'], self.table, df['Hours'])
+        self.members = members.cat.categories
+        self.categories = category.cat.categories
+
+        # one key per record: the member, then the day; the records sorted by key
+        self.first_day = days.min() if len(days) else 0
+        self.span = (days.max() - self.first_day + 2) if len(days) else 1
+        codes = members.cat.codes.to_numpy().astype(np.int64)
+        keys = codes * self.span + (days - self.first_day)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+
+        # running totals of the quantities, one column per category, starting at zero
+        values = np.zeros((len(order), len(self.categories)))
+        values[np.arange(len(order)), category.cat.codes.to_numpy()[order]] = quantity[order]
+        self.cumulative = np.vstack([np.zeros((1, len(self.categories))), values.cumsum(axis=0)])
+
+    def first_date(self):
+        return None if len(self.keys) == 0 else self._date(self.first_day)
+
+    def last_date(self):
+        return None if len(self.keys) == 0 else self._date(self.first_day + self.span - 2)
+
+    def _date(self, day):
+        return pd.Timestamp(np.datetime64(int(day), 'D'))
+
+    def _day(self, date, default):
+        if date is None:
+            return default
+        day = np.datetime64(pd.Timestamp(date).normalize().date(), 'D').astype(np.int64)
+        # dates outside the timeline are moved to just outside it
+        return int(min(max(day - self.first_day, -1), self.span - 1))
+
+    def quantities(self, start=None, end=None):
+        # the quantities of each member and category from start to end (dates included);
+        # only the members with records in the range
+        start_day = self._day(start, 0)
+        end_day = self._day(end, self.span - 1)
+        base = np.arange(len(self.members), dtype=np.int64) * self.span
+        lo = np.searchsorted(self.keys, base + start_day, 'left')
+        hi = np.searchsorted(self.keys, base + end_day, 'right')
+        present = hi > lo
+        totals = self.cumulative[hi[present]] - self.cumulative[lo[present]]
+        # the running totals add rounding noise to the differences
+        return pd.DataFrame(totals.round(6), columns=self.categories,
+                            index=pd.Index(self.members[present], name='Member Name'))
+
+    def totals(self, start=None, end=None):
+        # the summary table of the records from start to end, as scoring.aggregate()
+        totals = self.quantities(start, end)
+        if totals.empty:
+            return empty_summary()
+        return summary_table(totals, self.table)
+
+    def by_period(self, freq='Q', start=None, end=None):
+        # the summary of each period (pandas frequency: 'M', 'Q', 'Y', 'Y-JUN' for
+        # fiscal years ending in June, ...), one after the other with a 'Period' column
+        start = self.first_date() if start is None else pd.Timestamp(start)
+        end = self.last_date() if end is None else pd.Timestamp(end)
+        if start is None:
+            return empty_summary()
+        results = []
+        for period in pd.period_range(start, end, freq=freq):
+            summary = self.totals(period.start_time, period.end_time)
+            if summary.empty:
+                continue
+            summary.insert(0, 'Period', str(period))
+            results.append(summary)
+        if not results:
+            return empty_summary()
+        return pd.concat(results, ignore_index=True)
@@ -0,0 +1,108 @@
+# Checks of the self-reported activity rows
+#
+# The import quietly fixes up some entries (missing hours count as 1 hour, rows without
+# an activity are dropped) and takes others at face value. These checks flag such rows
+# so they can be looked at. All rows are checked at once: every rule is a vectorized
+# condition over the whole activity table, and the rows that fail are collected into
+# one anomaly report with the member, file and row.
+#
+# The rules can be changed by passing a dictionary with the same keys as default_rules.
+
+import pandas as pd
+
+from compact import map_names
+from export import export_table, table_format, write_summary_workbook
+
+default_rules = {
+    # maximum hours for one entry, per activity (a 30-hour drill is most likely a typo)
+    'max_hours': {
+        'Meetings': 8,
+        'Drills, CMEs': 12,
+        'Training Course': 24,
+        'Miscellaneous': 24,
+        'Disability': 24,
+    },
+    'default_max_hours': 24,
+    # maximum points for one entry
+    'max_points': 5,
+    # activities that are scored; anything else is ignored by the calculation
+    'activities': ['Meetings', 'Drills, CMEs', 'Training Course', 'Miscellaneous', 'Disability'],
+    # activities whose points depend on the hours (a meeting counts once, whatever its hours)
+    'hours_activities': ['Training Course', 'Drills, CMEs'],
+    # flag the same activity entered twice on the same date by the same member
+    'duplicates': True,
+}
+
+anomaly_columns = ['Member Name', 'Source', 'Row', 'Date', 'Activity', 'Problem', 'Value']
+
+
+def make_rules(rules=None):
+    merged = dict(default_rules)
+    merged.update(rules or {})
+    return merged
+
+
+def validate_activities(df_losap, rules=None, fix_name=None):
+    # df_losap: activity rows as read from the spreadsheets (before the points are
+    # calculated). fix_name is applied to the member names (once per distinct name)
+    rules = make_rules(rules)
+    if df_losap is None or len(df_losap) == 0:
+        return pd.DataFrame(columns=anomaly_columns)
+
+    activity = df_losap['Activity']
+    hours = pd.to_numeric(df_losap['Hours'], errors='coerce')
+    points = pd.to_numeric(df_losap['Points'], errors='coerce')
+    has_activity = activity.notna()
+    scored = activity.isin(rules['activities'])
+    by_hours = activity.isin(rules['hours_activities'])
+    max_hours = activity.map(rules['max_hours']).fillna(rules['default_max_hours'])
+
+    checks = [
+        ('Missing activity (row ignored)', ~has_activity, df_losap['Description']),
+        ('Unknown activity (row ignored)', has_activity & ~scored, activity),
+        ('Missing date', scored & df_losap['Date'].isna(), df_losap['Date']),
+        ('Missing hours (counted as 1 hour)', by_hours & df_losap['Hours'].isna(), df_losap['Hours']),
+        ('Hours not a number', df_losap['Hours'].notna() & hours.isna(), df_losap['Hours']),
+        ('Points not a number', df_losap['Points'].notna() & points.isna(), df_losap['Points']),
+        ('Negative hours', hours < 0, hours),
+        ('Negative points', points < 0, points),
+        ('Too many hours', hours > max_hours, hours),
+        ('Too many points', points > rules['max_points'], points),
+    ]
+    if rules['duplicates']:
+        keys = ['Member Name', 'Date', 'Activity']
+        duplicated = df_losap.duplicated(subset=keys, keep=False) & df_losap['Date'].notna() & scored
+        checks.append(('Duplicate entry (same date and activity)', duplicated, df_losap['Date']))
+
+    frames = []
+    for problem, mask, values in checks:
+        mask = mask.fillna(False).to_numpy(dtype=bool)
+        if mask.any():
+            rows = df_losap.loc[mask, ['Member Name', 'Source', 'Row', 'Date', 'Activity']].copy()
+            rows['Problem'] = problem
+            rows['Value'] = pd.Series(values.to_numpy()[mask], index=rows.index).astype(str)
+            frames.append(rows)
+    if not frames:
+        return pd.DataFrame(columns=anomaly_columns)
+
+    anomalies = pd.concat(frames)
+    anomalies['Member Name'] = anomalies['Member Name'].astype(str)
+    if fix_name is not None:
+        anomalies['Member Name'] = map_names(anomalies['Member Name'], fix_name).astype(str)
+    anomalies['Activity'] = anomalies['Activity'].astype(object)
+    anomalies = anomalies.sort_values(['Member Name', 'Source', 'Row'], kind='stable')
+    return anomalies[anomaly_columns].reset_index(drop=True)
+
+
+def anomaly_counts(anomalies):
+    # number of anomalies per member and file
+    return anomalies.groupby(['Member Name', 'Source']).size().reset_index(name='Anomalies')
+
+
+def write_anomaly_report(file_name, anomalies):
+    # xlsx: the number of problems per member and file, then the problems themselves
+    if table_format(file_name) is None:
+        write_summary_workbook(file_name, anomaly_counts(anomalies), 'Per Member',
+                               anomalies, 'Data Validation')
+    else:
+        export_table(file_name, anomalies)